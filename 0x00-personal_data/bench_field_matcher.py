@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Regex alternation vs FieldMatcher as the number of fields grows.
+"""
+import logging
+import random
+import string
+import timeit
+
+filtered_logger = __import__('filtered_logger')
+
+MESSAGE = ("name=Marlene Wood;email=hwestiii@att.net;phone=(473) 401-4253;"
+           "ssn=261-72-6780;password=K5?BMNv;"
+           "ip=60ed:c396:2ff:244:bbd0:9208:26f2:93ea;"
+           "last_login=2019-11-14 06:14:24;user_agent=Mozilla/5.0;")
+FIELD_COUNTS = (5, 50, 500, 5000)
+
+
+def make_fields(count: int, rng: random.Random) -> list:
+    """
+    Returns PII_FIELDS padded with random tenant-style keys.
+    """
+    fields = list(filtered_logger.PII_FIELDS)
+    while len(fields) < count:
+        fields.append("tenant_" + "".join(
+            rng.choice(string.ascii_lowercase) for _ in range(10)))
+    return fields[:count]
+
+
+if __name__ == "__main__":
+    rng = random.Random(0)
+    number = 5000
+    record = logging.LogRecord("user_data", logging.INFO, __file__, 0,
+                               MESSAGE, None, None)
+    print("{:>6} {:>12} {:>12}".format("fields", "regex us", "set us"))
+    for count in FIELD_COUNTS:
+        fields = make_fields(count, rng)
+        timings = []
+        for matcher in ("regex", "set"):
+            formatter = filtered_logger.RedactingFormatter(
+                fields, matcher=matcher)
+            timings.append(timeit.timeit(
+                lambda: formatter.format(record), number=number) / number)
+        print("{:>6} {:>12.2f} {:>12.2f}".format(
+            count, timings[0] * 1e6, timings[1] * 1e6))
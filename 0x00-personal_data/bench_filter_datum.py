@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark: compiled filter_datum vs the original implementation.
+"""
+import re
+import timeit
+from typing import List
+
+filter_datum = __import__('filtered_logger').filter_datum
+PII_FIELDS = __import__('filtered_logger').PII_FIELDS
+
+
+def legacy_filter_datum(
+        fields: List[str], redaction: str, message: str, separator: str
+) -> str:
+    """
+    The original filter_datum, rebuilding its pattern on every call.
+    Args:
+        fields (List[str]): List of field names to obfuscate.
+        redaction (str): String to replace the field values with.
+        message (str): The original log message.
+        separator (str): Unused, kept for signature compatibility.
+    Returns:
+        str: The obfuscated log message.
+    """
+    pattern = '|'.join([f"{field}=[^;]*" for field in fields])
+    return re.sub(
+        pattern, lambda x: f"{x.group().split('=')[0]}={redaction}", message)
+
+
+MESSAGE = ("name=Marlene Wood;email=hwestiii@att.net;phone=(473) 401-4253;"
+           "ssn=261-72-6780;password=K5?BMNv;"
+           "ip=60ed:c396:2ff:244:bbd0:9208:26f2:93ea;"
+           "last_login=2019-11-14 06:14:24;user_agent=Mozilla/5.0;")
+
+
+def bench(func, number: int) -> float:
+    """
+    Runs func over MESSAGE `number` times.
+    Args:
+        func: A filter_datum-compatible callable.
+        number (int): Number of calls to time.
+    Returns:
+        float: Calls per second.
+    """
+    elapsed = timeit.timeit(
+        lambda: func(list(PII_FIELDS), "***", MESSAGE, ";"), number=number)
+    return number / elapsed
+
+
+if __name__ == "__main__":
+    number = 200000
+    assert filter_datum(list(PII_FIELDS), "***", MESSAGE, ";") == \
+        legacy_filter_datum(list(PII_FIELDS), "***", MESSAGE, ";")
+    legacy = bench(legacy_filter_datum, number)
+    compiled = bench(filter_datum, number)
+    print("legacy   : {:>12,.0f} calls/s".format(legacy))
+    print("compiled : {:>12,.0f} calls/s".format(compiled))
+    print("speedup  : {:.2f}x".format(compiled / legacy))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Scaling of hash_passwords / verify_many over worker counts.
+"""
+import os
+import sys
+import time
+
+encrypt_password = __import__('encrypt_password')
+
+
+def bench(workers: int, number: int, use_threads: bool) -> float:
+    """
+    Hashes `number` passwords with `workers` workers.
+    Args:
+        workers (int): Pool size.
+        number (int): Passwords to hash.
+        use_threads (bool): Thread pool instead of process pool.
+    Returns:
+        float: Hashes per second.
+    """
+    passwords = ["MyAmazingPassw0rd{}".format(i) for i in range(number)]
+    start = time.perf_counter()
+    for _ in encrypt_password.hash_passwords(
+            passwords, workers=workers, chunk_size=1,
+            use_threads=use_threads):
+        pass
+    return number / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    use_threads = "--threads" in sys.argv[1:]
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    baseline = None
+    print("{} pool, {} cores".format(
+        "thread" if use_threads else "process", cores))
+    for workers in counts:
+        rate = bench(workers, 8 * workers, use_threads)
+        baseline = baseline or rate
+        print("workers {:>3}: {:8.2f} hashes/s  speedup {:5.2f}x".format(
+            workers, rate, rate / baseline))
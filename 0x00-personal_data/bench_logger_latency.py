@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Caller-side latency of logger.info with and without the async queue.
+"""
+import logging
+import os
+import time
+from typing import IO, List
+
+filtered_logger = __import__('filtered_logger')
+
+MESSAGE = ("name=Marlene Wood;email=hwestiii@att.net;phone=(473) 401-4253;"
+           "ssn=261-72-6780;password=K5?BMNv;"
+           "ip=60ed:c396:2ff:244:bbd0:9208:26f2:93ea;"
+           "last_login=2019-11-14 06:14:24;user_agent=Mozilla/5.0;")
+
+
+def make_logger(name: str, asynchronous: bool,
+                devnull: IO[str]) -> logging.Logger:
+    """
+    Builds a redacting logger writing to os.devnull.
+    Args:
+        name (str): Logger name.
+        asynchronous (bool): Whether to put the queue in front of it.
+        devnull (IO[str]): Open os.devnull, left open by the handler.
+    Returns:
+        logging.Logger: The configured logger.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(
+        filtered_logger.RedactingFormatter(filtered_logger.PII_FIELDS))
+    if asynchronous:
+        handler = filtered_logger.AsyncBatchHandler(handler, maxsize=100000)
+    logger.addHandler(handler)
+    return logger
+
+
+def measure(logger: logging.Logger, number: int) -> List[float]:
+    """
+    Times `number` logger.info calls individually.
+    Args:
+        logger (logging.Logger): The logger to call.
+        number (int): Number of calls.
+    Returns:
+        List[float]: Sorted per-call latencies in microseconds.
+    """
+    timings = []
+    clock = time.perf_counter
+    for _ in range(number):
+        start = clock()
+        logger.info(MESSAGE)
+        timings.append((clock() - start) * 1e6)
+    timings.sort()
+    return timings
+
+
+def report(label: str, timings: List[float]) -> None:
+    """
+    Prints mean, p50 and p99 of a latency sample.
+    """
+    print("{:<6} mean {:7.2f}us  p50 {:7.2f}us  p99 {:7.2f}us".format(
+        label, sum(timings) / len(timings), timings[len(timings) // 2],
+        timings[int(len(timings) * 0.99)]))
+
+
+if __name__ == "__main__":
+    number = 50000
+    with open(os.devnull, "w") as devnull:
+        sync_logger = make_logger("bench_sync", False, devnull)
+        async_logger = make_logger("bench_async", True, devnull)
+        try:
+            report("sync", measure(sync_logger, number))
+            start = time.perf_counter()
+            report("async", measure(async_logger, number))
+            async_logger.handlers[0].flush()
+            print("async drained {} records in {:.2f}s".format(
+                number, time.perf_counter() - start))
+        finally:
+            for logger in (sync_logger, async_logger):
+                for handler in logger.handlers:
+                    handler.close()
+                logger.handlers = []
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the redaction and logging path.
+
+Synthetic records shaped like user_data.csv are pushed through
+filter_datum, RedactingFormatter.format and a redacting logger while
+sweeping message length, number of redacted fields and handler type.
+Each case reports ops/sec, p50/p99 latency and the peak traced memory
+during a call (peak_bytes). Results can be saved as JSON and two runs compared:
+
+    ./benchmark.py --out before.json
+    ./benchmark.py --out after.json
+    ./benchmark.py --compare before.json after.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import IO, Callable, Dict, List
+
+filtered_logger = __import__('filtered_logger')
+
+COLUMNS = ("name", "email", "phone", "ssn", "password", "ip", "last_login",
+           "user_agent")
+MESSAGE_LENGTHS = (128, 1024, 8192)
+FIELD_COUNTS = (1, 3, 5)
+HANDLERS = ("stream", "file", "async")
+
+
+def synthetic_record(rng: random.Random, length: int) -> str:
+    """
+    Builds one `key=value;` message padded to roughly `length` chars.
+    Args:
+        rng (random.Random): Source of randomness.
+        length (int): Target message length; the user agent is padded.
+    Returns:
+        str: The message.
+    """
+    def word(n: int) -> str:
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(n))
+
+    values = {
+        "name": "{} {}".format(word(6).title(), word(8).title()),
+        "email": "{}@{}.com".format(word(8), word(5)),
+        "phone": "({}) {}-{}".format(rng.randint(200, 999),
+                                     rng.randint(200, 999),
+                                     rng.randint(1000, 9999)),
+        "ssn": "{}-{}-{}".format(rng.randint(100, 999),
+                                 rng.randint(10, 99),
+                                 rng.randint(1000, 9999)),
+        "password": word(10),
+        "ip": ":".join("{:x}".format(rng.randint(0, 0xffff))
+                       for _ in range(8)),
+        "last_login": "2019-11-14 06:{:02d}:{:02d}".format(
+            rng.randint(0, 59), rng.randint(0, 59)),
+        "user_agent": "Mozilla/5.0 ",
+    }
+    message = "".join("{}={};".format(k, values[k]) for k in COLUMNS)
+    if len(message) < length:
+        values["user_agent"] += word(length - len(message))
+        message = "".join("{}={};".format(k, values[k]) for k in COLUMNS)
+    return message
+
+
+def measure(func: Callable[[str], object], messages: List[str],
+            number: int) -> Dict[str, float]:
+    """
+    Times `number` calls of func cycling over messages.
+    Args:
+        func (Callable[[str], object]): The operation under test.
+        messages (List[str]): Inputs cycled through.
+        number (int): Calls timed.
+    Returns:
+        Dict[str, float]: ops_per_sec, p50_us, p99_us and peak_bytes, the
+        mean peak of traced memory above its level before each call.
+    """
+    clock = time.perf_counter
+    timings = []
+    for i in range(number):
+        message = messages[i % len(messages)]
+        start = clock()
+        func(message)
+        timings.append(clock() - start)
+    timings.sort()
+
+    # Allocation pass kept separate: tracing slows every call down
+    sample = min(number, 200)
+    peak_total = 0
+    tracemalloc.start()
+    for i in range(sample):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func(messages[i % len(messages)])
+        peak_total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+
+    return {
+        "ops_per_sec": number / sum(timings),
+        "p50_us": timings[len(timings) // 2] * 1e6,
+        "p99_us": timings[int(len(timings) * 0.99)] * 1e6,
+        "peak_bytes": peak_total / sample,
+    }
+
+
+def make_logger(kind: str, fields: List[str], tmpdir: str,
+                devnull: IO[str]) -> logging.Logger:
+    """
+    Builds a redacting logger with the given handler type.
+    Args:
+        kind (str): "stream" (devnull), "file" or "async".
+        fields (List[str]): Fields to redact.
+        tmpdir (str): Directory for the file handler.
+        devnull (IO[str]): Open os.devnull, left open by the handler.
+    Returns:
+        logging.Logger: A logger named after the case.
+    """
+    logger = logging.getLogger("benchmark.{}.{}".format(kind, len(fields)))
+    logger.handlers = []
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if kind == "file":
+        handler = logging.FileHandler(
+            os.path.join(tmpdir, "{}.log".format(len(fields))))
+    else:
+        handler = logging.StreamHandler(devnull)
+    handler.setFormatter(filtered_logger.RedactingFormatter(fields))
+    if kind == "async":
+        handler = filtered_logger.AsyncBatchHandler(handler, maxsize=0)
+    logger.addHandler(handler)
+    return logger
+
+
+def run(number: int, seed: int) -> Dict[str, object]:
+    """
+    Runs every case of the sweep.
+    Args:
+        number (int): Calls per case.
+        seed (int): Seed of the synthetic data.
+    Returns:
+        Dict[str, object]: Run metadata and a result per case name.
+    """
+    rng = random.Random(seed)
+    results = {}
+    redaction = filtered_logger.RedactingFormatter.REDACTION
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            open(os.devnull, "w") as devnull:
+        for length in MESSAGE_LENGTHS:
+            messages = [synthetic_record(rng, length) for _ in range(100)]
+            for count in FIELD_COUNTS:
+                fields = list(filtered_logger.PII_FIELDS[:count])
+                case = "len={},fields={}".format(length, count)
+
+                results["filter_datum[{}]".format(case)] = measure(
+                    lambda m: filtered_logger.filter_datum(
+                        fields, redaction, m, ";"), messages, number)
+
+                formatter = filtered_logger.RedactingFormatter(fields)
+                records = {m: logging.LogRecord("user_data", logging.INFO,
+                                                __file__, 0, m, None, None)
+                           for m in messages}
+                results["formatter[{}]".format(case)] = measure(
+                    lambda m: formatter.format(records[m]), messages, number)
+
+                for kind in HANDLERS:
+                    logger = make_logger(kind, fields, tmpdir, devnull)
+                    results["logger.{}[{}]".format(kind, case)] = measure(
+                        logger.info, messages, number)
+                    for handler in logger.handlers:
+                        handler.close()
+                    logger.handlers = []
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "number": number,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def print_run(data: Dict[str, object]) -> None:
+    """
+    Prints a run as a table.
+    """
+    print("{:<42} {:>12} {:>9} {:>9} {:>10}".format(
+        "case", "ops/s", "p50 us", "p99 us", "peak B"))
+    for name, r in data["results"].items():
+        print("{:<42} {:>12,.0f} {:>9.2f} {:>9.2f} {:>10,.0f}".format(
+            name, r["ops_per_sec"], r["p50_us"], r["p99_us"],
+            r["peak_bytes"]))
+
+
+def compare(before: Dict[str, object], after: Dict[str, object]) -> None:
+    """
+    Prints the ops/sec and p99 change of each case present in both runs.
+    """
+    print("{:<42} {:>12} {:>12} {:>8} {:>8}".format(
+        "case", "before ops/s", "after ops/s", "ops", "p99"))
+    for name, old in before["results"].items():
+        new = after["results"].get(name)
+        if new is None:
+            continue
+        print("{:<42} {:>12,.0f} {:>12,.0f} {:>+7.1f}% {:>+7.1f}%".format(
+            name, old["ops_per_sec"], new["ops_per_sec"],
+            (new["ops_per_sec"] / old["ops_per_sec"] - 1) * 100,
+            (new["p99_us"] / old["p99_us"] - 1) * 100))
+
+
+def main(argv: List[str] = None) -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--number", type=int, default=5000,
+                        help="calls per case (default: 5000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="compare two saved runs instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            compare(json.load(f), json.load(g))
+        return
+
+    data = run(args.number, args.seed)
+    print_run(data)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(data, f, indent=2)
+        print("results saved to {}".format(args.out), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Bulk redaction of PII columns in large CSV dumps shaped like user_data.csv.
+
+The input is memory-mapped and split into line-aligned chunks, which a
+process pool redacts in parallel. Chunks are written back in their
+original order while at most a few per worker are in flight, so memory
+stays bounded however large the file is. Records must not span lines.
+
+Columns are picked by filtered_logger.pii_columns, like the export path.
+Only the bytes of redacted fields change: the delimiter and quote
+character are sniffed from the header, and every other field, its
+quoting and the line endings are copied as they are.
+"""
+import argparse
+import csv
+import io
+import mmap
+import os
+import re
+import sys
+from collections import deque
+from multiprocessing import Pool
+from typing import Iterator, List, Optional, Pattern, Sequence, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, pii_columns
+
+
+def chunk_bounds(mm: mmap.mmap, start: int,
+                 chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """
+    Splits mm[start:] into ranges ending on a newline.
+    Args:
+        mm (mmap.mmap): The mapped file.
+        start (int): Offset of the first data byte.
+        chunk_size (int): Approximate size of each range in bytes.
+    Returns:
+        Iterator[Tuple[int, int]]: (start, end) byte ranges.
+    """
+    size = len(mm)
+    while start < size:
+        end = mm.find(b"\n", min(start + chunk_size, size - 1))
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+
+def sniff_dialect(header: str) -> Tuple[str, str]:
+    """
+    Guesses the delimiter and quote character from the header line.
+    Args:
+        header (str): The first line of the CSV.
+    Returns:
+        Tuple[str, str]: The delimiter and the quote character, "," and
+        '"' if the header gives no clue.
+    """
+    try:
+        dialect = csv.Sniffer().sniff(header, delimiters=",;\t|")
+    except csv.Error:
+        return ",", '"'
+    return dialect.delimiter, dialect.quotechar or '"'
+
+
+def _line_pattern(columns: Sequence[int], delimiter: str,
+                  quotechar: str) -> Pattern:
+    """
+    Matches a line up to its last redacted field, capturing each
+    redacted field; a field is quoted, or runs up to the delimiter.
+    """
+    d, q = re.escape(delimiter), re.escape(quotechar)
+    field = "{q}(?:[^{q}]|{q}{q})*{q}|[^{d}{q}\r\n]*".format(d=d, q=q)
+    wanted = set(columns)
+    return re.compile(d.join(
+        ("({})" if i in wanted else "(?:{})").format(field)
+        for i in range(max(columns) + 1)) + "(?=[{}\r\n]|$)".format(d))
+
+
+def redact_line(line: str, pattern: Pattern, columns: Sequence[int],
+                delimiter: str, quotechar: str, redaction: str) -> str:
+    """
+    Replaces the given columns of one CSV line, leaving other bytes as is.
+
+    A replaced field keeps its quotes if it had any. Lines the pattern
+    does not match, such as short rows or a stray quote, are parsed and
+    written again by the csv module with the same delimiter and quote
+    character.
+    Args:
+        line (str): The line, with its line ending.
+        pattern (Pattern): _line_pattern(columns, delimiter, quotechar).
+        columns (Sequence[int]): Indexes of the columns to redact.
+        delimiter (str): Field delimiter.
+        quotechar (str): Quote character.
+        redaction (str): Replacement value.
+    Returns:
+        str: The redacted line.
+    """
+    match = pattern.match(line)
+    if match is None:
+        return _rewrite_line(line, columns, delimiter, quotechar, redaction)
+    quoted = quotechar + redaction.replace(quotechar, quotechar * 2) + \
+        quotechar
+    bare = quoted if delimiter in redaction or quotechar in redaction \
+        else redaction
+    parts = []
+    last = 0
+    for group in range(1, pattern.groups + 1):
+        start, end = match.span(group)
+        parts.append(line[last:start])
+        parts.append(quoted if line.startswith(quotechar, start) else bare)
+        last = end
+    parts.append(line[last:])
+    return "".join(parts)
+
+
+def _rewrite_line(line: str, columns: Sequence[int], delimiter: str,
+                  quotechar: str, redaction: str) -> str:
+    """
+    Redacts one line through the csv module, keeping its line ending.
+    """
+    row = next(csv.reader([line], delimiter=delimiter,
+                          quotechar=quotechar), [])
+    for i in columns:
+        if i < len(row):
+            row[i] = redaction
+    out = io.StringIO()
+    csv.writer(out, delimiter=delimiter, quotechar=quotechar,
+               lineterminator="").writerow(row)
+    return out.getvalue() + line[len(line.rstrip("\r\n")):]
+
+
+def redact_chunk(path: str, start: int, end: int, columns: Sequence[int],
+                 redaction: str, delimiter: str = ",",
+                 quotechar: str = '"') -> bytes:
+    """
+    Redacts the given columns of every CSV record in a byte range.
+
+    Runs in a worker process, which maps the file itself so only offsets
+    cross the process boundary.
+    Args:
+        path (str): The CSV file.
+        start (int): First byte of the range.
+        end (int): Byte after the last one of the range.
+        columns (Sequence[int]): Indexes of the columns to redact, in
+            ascending order.
+        redaction (str): Replacement value.
+        delimiter (str): Field delimiter of the file.
+        quotechar (str): Quote character of the file.
+    Returns:
+        bytes: The redacted range.
+    """
+    with open(path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode("utf-8")
+    if not columns:
+        return text.encode("utf-8")
+    pattern = _line_pattern(columns, delimiter, quotechar)
+    return "".join(
+        redact_line(line, pattern, columns, delimiter, quotechar, redaction)
+        if line.strip() else line
+        for line in text.splitlines(keepends=True)).encode("utf-8")
+
+
+def _redact_chunk(args: tuple) -> bytes:
+    """
+    Pool entry point unpacking the arguments of redact_chunk.
+    """
+    return redact_chunk(*args)
+
+
+def bulk_redact(src: str, dst: str, fields: Sequence[str] = PII_FIELDS,
+                workers: Optional[int] = None,
+                chunk_size: int = 8 * 1024 * 1024,
+                redaction: str = RedactingFormatter.REDACTION) -> int:
+    """
+    Writes a copy of `src` to `dst` with the `fields` columns redacted.
+    Args:
+        src (str): Input CSV path; the first line is the header.
+        dst (str): Output CSV path.
+        fields (Sequence[str]): Field names to redact; a column matches
+            when its name ends with one, as in pii_columns.
+        workers (Optional[int]): Processes to use, default os.cpu_count().
+        chunk_size (int): Approximate bytes handed to a worker at once.
+        redaction (str): Replacement value.
+    Returns:
+        int: Number of data bytes processed.
+    """
+    workers = workers or os.cpu_count() or 1
+    with open(src, "rb") as f, open(dst, "wb") as out:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            header_end = mm.find(b"\n")
+            header_end = len(mm) if header_end == -1 else header_end + 1
+            header_line = mm[:header_end].decode("utf-8")
+            delimiter, quotechar = sniff_dialect(header_line)
+            header = next(csv.reader([header_line], delimiter=delimiter,
+                                     quotechar=quotechar), [])
+            columns = pii_columns(header, fields)
+            out.write(mm[:header_end])
+
+            bounds = chunk_bounds(mm, header_end, chunk_size)
+            with Pool(workers) as pool:
+                pending: deque = deque()
+                for start, end in bounds:
+                    pending.append(pool.apply_async(
+                        _redact_chunk,
+                        ((src, start, end, columns, redaction, delimiter,
+                          quotechar),)))
+                    # Keep a bounded window of chunks in flight
+                    if len(pending) >= 2 * workers:
+                        out.write(pending.popleft().get())
+                while pending:
+                    out.write(pending.popleft().get())
+            return len(mm) - header_end
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("src", help="input CSV")
+    parser.add_argument("dst", help="output CSV")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-mb", type=int, default=8,
+                        help="approximate chunk size in MiB (default: 8)")
+    args = parser.parse_args(argv)
+    size = bulk_redact(args.src, args.dst, workers=args.workers,
+                       chunk_size=args.chunk_mb * 1024 * 1024)
+    print("redacted {:,} bytes".format(size), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Pooled connection provider for the personal data database.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection could be checked out within the timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    A bounded pool of DB-API connections.
+
+    The backend is any zero-argument callable returning a new connection,
+    so the same pool serves MySQL in production and SQLite in tests.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int = 5,
+                 timeout: float = 30.0, recycle: float = 3600.0,
+                 pre_ping: bool = True):
+        """
+        Initialize the pool.
+
+        Args:
+            connect (Callable[[], Any]): Factory opening a new connection.
+            size (int): Maximum number of open connections.
+            timeout (float): Seconds a checkout waits for a free connection.
+            recycle (float): Age in seconds after which a connection is
+                closed and replaced; 0 or less disables recycling.
+            pre_ping (bool): Whether to check a connection with `SELECT 1`
+                before handing it out.
+        """
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._idle = deque()
+        self._checked_out: Dict[int, Tuple[Any, float]] = {}
+        self._opened = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.metrics: Dict[str, int] = {
+            "checkouts": 0, "checkins": 0, "creations": 0, "waits": 0,
+            "timeouts": 0, "recycled": 0, "ping_failures": 0,
+            "reset_failures": 0,
+        }
+
+    def _create(self) -> Tuple[Any, float]:
+        """
+        Opens a new connection in a slot the caller already reserved.
+        """
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.metrics["creations"] += 1
+        return conn, time.monotonic()
+
+    def _discard(self, conn: Any) -> None:
+        """
+        Closes a connection and frees its slot.
+        """
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._opened -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _ping(conn: Any) -> bool:
+        """
+        Returns True if the connection answers `SELECT 1`.
+        """
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _is_stale(self, conn: Any, created: float) -> bool:
+        """
+        Returns True if an idle connection must be replaced before use.
+        """
+        if 0 < self.recycle < time.monotonic() - created:
+            with self._cond:
+                self.metrics["recycled"] += 1
+            return True
+        if self.pre_ping and not self._ping(conn):
+            with self._cond:
+                self.metrics["ping_failures"] += 1
+            return True
+        return False
+
+    def acquire(self, timeout: Optional[float] = None) -> Any:
+        """
+        Checks out a connection, opening one if the pool is not full.
+
+        Args:
+            timeout (Optional[float]): Overrides the pool checkout timeout.
+        Returns:
+            A live connection, to be handed back with `release`.
+        Raises:
+            PoolTimeout: If no connection frees up in time.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        conn = None
+        with self._cond:
+            waited = False
+            while True:
+                if self._closed:
+                    raise RuntimeError("pool is closed")
+                if self._idle:
+                    conn, created = self._idle.pop()
+                    break
+                if self._opened < self.size:
+                    self._opened += 1
+                    break
+                if not waited:
+                    waited = True
+                    self.metrics["waits"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics["timeouts"] += 1
+                    raise PoolTimeout(
+                        "no connection available after {:.1f}s".format(
+                            timeout))
+                self._cond.wait(remaining)
+
+        if conn is None:
+            conn, created = self._create()
+        elif self._is_stale(conn, created):
+            # Replace the stale connection in the same slot
+            try:
+                conn.close()
+            except Exception:
+                pass
+            conn, created = self._create()
+
+        with self._cond:
+            self.metrics["checkouts"] += 1
+            self._checked_out[id(conn)] = (conn, created)
+        return conn
+
+    def release(self, conn: Any) -> None:
+        """
+        Returns a checked-out connection to the pool.
+
+        The connection is rolled back first, so the next borrower does not
+        inherit an open transaction or its locks; a connection that fails
+        to roll back is closed instead of pooled.
+
+        Args:
+            conn: A connection obtained from `acquire`.
+        Raises:
+            ValueError: If the connection is not checked out from this
+                pool, e.g. released twice.
+        """
+        with self._cond:
+            checked_out = self._checked_out.get(id(conn))
+            if checked_out is None or checked_out[0] is not conn:
+                raise ValueError(
+                    "connection is not checked out from this pool")
+            del self._checked_out[id(conn)]
+            self.metrics["checkins"] += 1
+        try:
+            conn.rollback()
+        except Exception:
+            with self._cond:
+                self.metrics["reset_failures"] += 1
+            self._discard(conn)
+            return
+        with self._cond:
+            if not self._closed:
+                self._idle.append(checked_out)
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """
+        Context manager checking a connection out and back in.
+
+        Args:
+            timeout (Optional[float]): Overrides the pool checkout timeout.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """
+        Closes every idle connection; checked-out ones close on release.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+def pool_from_env(connect: Optional[Callable[[], Any]] = None
+                  ) -> ConnectionPool:
+    """
+    Builds a pool configured from the PERSONAL_DATA_DB_* variables.
+
+    Connections come from `filtered_logger.get_db` unless another backend
+    is given, so PERSONAL_DATA_DB_SQLITE selects SQLite here as well.
+    Pool settings are read from PERSONAL_DATA_DB_POOL_SIZE (default 5),
+    PERSONAL_DATA_DB_POOL_TIMEOUT (30s), PERSONAL_DATA_DB_POOL_RECYCLE
+    (3600s) and PERSONAL_DATA_DB_POOL_PRE_PING (1).
+
+    Args:
+        connect (Optional[Callable[[], Any]]): Connection factory.
+    Returns:
+        ConnectionPool: A new, empty pool.
+    """
+    if connect is None:
+        from filtered_logger import get_db
+        connect = get_db
+    return ConnectionPool(
+        connect,
+        size=int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", "5")),
+        timeout=float(os.getenv("PERSONAL_DATA_DB_POOL_TIMEOUT", "30")),
+        recycle=float(os.getenv("PERSONAL_DATA_DB_POOL_RECYCLE", "3600")),
+        pre_ping=os.getenv("PERSONAL_DATA_DB_POOL_PRE_PING", "1") != "0")
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process-wide pool, creating it from the environment once.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pool_from_env()
+        return _pool
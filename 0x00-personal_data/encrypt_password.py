@@ -2,19 +2,166 @@
 
 """Contains excrypting functions"""
 
+import os
+import time
+from collections import deque
+from functools import partial
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
 import bcrypt
 
 
-def hash_password(password: str) -> bytes:
+# bcrypt's own default cost, used when nothing else is configured
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+
+_target_rounds: Optional[int] = None
+
+
+def time_rounds(rounds: int, samples: int = 3) -> float:
+    """
+    Measures how long one hash takes at a given cost on this host.
+    Args:
+        rounds (int): The bcrypt cost factor.
+        samples (int): Hashes timed; the fastest is kept.
+    Returns:
+        float: Seconds per hash.
+    """
+    best = float("inf")
+    for _ in range(samples):
+        salt = bcrypt.gensalt(rounds)
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", salt)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def timing_table(min_rounds: int = MIN_ROUNDS, max_rounds: int = MAX_ROUNDS,
+                 budget: Optional[float] = None,
+                 samples: int = 3) -> List[Tuple[int, float]]:
+    """
+    Times each cost from min_rounds up to max_rounds.
+
+    Each extra round doubles the work, so measuring stops at the first
+    cost over `budget` rather than timing the slower ones.
+    Args:
+        min_rounds (int): Lowest cost timed.
+        max_rounds (int): Highest cost timed.
+        budget (Optional[float]): Seconds after which timing stops.
+        samples (int): Hashes timed per cost.
+    Returns:
+        List[Tuple[int, float]]: (rounds, seconds per hash) pairs.
+    """
+    table = []
+    for rounds in range(min_rounds, max_rounds + 1):
+        seconds = time_rounds(rounds, samples)
+        table.append((rounds, seconds))
+        if budget is not None and seconds > budget:
+            break
+    return table
+
+
+def calibrate_rounds(target_ms: float = 250.0, min_rounds: int = MIN_ROUNDS,
+                     max_rounds: int = MAX_ROUNDS) -> int:
+    """
+    Picks the highest cost whose hash time stays within target_ms.
+    Args:
+        target_ms (float): Latency budget of one hash in milliseconds.
+        min_rounds (int): Cost returned even if it exceeds the budget.
+        max_rounds (int): Highest cost considered.
+    Returns:
+        int: The bcrypt cost factor to use.
+    """
+    table = timing_table(min_rounds, max_rounds, target_ms / 1000.0)
+    return _pick_rounds(table, target_ms, min_rounds)
+
+
+def _pick_rounds(table: List[Tuple[int, float]], target_ms: float,
+                 min_rounds: int) -> int:
+    """Returns the highest cost of a timing table within target_ms."""
+    chosen = min_rounds
+    for rounds, seconds in table:
+        if seconds * 1000.0 <= target_ms:
+            chosen = rounds
+    return chosen
+
+
+def calibrate_target_rounds(target_ms: Optional[float] = None) -> int:
+    """
+    Calibrates the cost new hashes use in this process.
+
+    Timing takes seconds, so this is meant to run once at startup, never
+    on a login path. The CLI prints the cost to store in
+    PERSONAL_DATA_BCRYPT_ROUNDS instead, which skips it altogether.
+    Args:
+        target_ms (Optional[float]): Latency budget of one hash, default
+            PERSONAL_DATA_BCRYPT_TARGET_MS, or 250 ms if that is unset.
+    Returns:
+        int: The calibrated cost, now returned by get_target_rounds.
+    """
+    global _target_rounds
+    if target_ms is None:
+        target_ms = float(os.getenv("PERSONAL_DATA_BCRYPT_TARGET_MS", "250"))
+    _target_rounds = calibrate_rounds(target_ms)
+    return _target_rounds
+
+
+def get_target_rounds() -> int:
+    """
+    Returns the bcrypt cost new hashes should use.
+
+    PERSONAL_DATA_BCRYPT_ROUNDS fixes the cost. Otherwise the cost found
+    by calibrate_target_rounds is used once it has run, and bcrypt's
+    default until then; this never calibrates by itself.
+    Returns:
+        int: The bcrypt cost factor.
+    """
+    rounds = os.getenv("PERSONAL_DATA_BCRYPT_ROUNDS")
+    if rounds:
+        return int(rounds)
+    if _target_rounds is not None:
+        return _target_rounds
+    return DEFAULT_ROUNDS
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """
+    Reads the cost factor stored in a bcrypt hash ($2b$<cost>$...).
+    Args:
+        hashed_password (bytes): A bcrypt hash.
+    Returns:
+        int: Its cost factor.
+    """
+    return int(hashed_password.split(b"$")[2])
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """
+    Tells whether a stored hash uses a lower cost than the target.
+
+    Hashes above the target are kept: a host calibrating a lower cost
+    must not weaken them.
+    Args:
+        hashed_password (bytes): A bcrypt hash.
+    Returns:
+        bool: True if the password should be hashed again.
+    """
+    return hash_rounds(hashed_password) < get_target_rounds()
+
+
+def hash_password(password: str, rounds: Optional[int] = None) -> bytes:
     """
     Hashes a password with a randomly generated salt.
     Args:
         password (str): The password to hash.
+        rounds (Optional[int]): Cost factor, default get_target_rounds().
     Returns:
         bytes: The salted, hashed password.
     """
     # Generate a salt
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds or get_target_rounds())
 
     # Hash the password with the salt
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
@@ -22,13 +169,127 @@ def hash_password(password: str) -> bytes:
     return hashed_password
 
 
-def is_valid(hashed_password: bytes, password: str) -> bool:
+def is_valid(hashed_password: bytes, password: str,
+             on_outdated: Optional[Callable[[bytes, str], None]] = None
+             ) -> bool:
     """
     Validates that the provided password matches the hashed password.
     Args:
         hashed_password (bytes): The previously hashed password.
         password (str): The plain-text password to validate.
+        on_outdated (Optional[Callable[[bytes, str], None]]): Called with
+            the hash and password when the password is valid but the hash
+            cost is below get_target_rounds(), so the caller can store
+            hash_password(password) in its place.
     Returns:
         bool: True if the password is valid, False otherwise.
     """
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+    valid = bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+    if valid and on_outdated is not None and needs_rehash(hashed_password):
+        on_outdated(hashed_password, password)
+    return valid
+
+
+def _hash_chunk(passwords: List[str], rounds: int) -> List[bytes]:
+    """Hashes a chunk of passwords in a worker."""
+    return [hash_password(password, rounds) for password in passwords]
+
+
+def _verify_chunk(pairs: List[Tuple[bytes, str]]) -> List[bool]:
+    """Checks a chunk of (hashed_password, password) pairs in a worker."""
+    return [is_valid(hashed, password) for hashed, password in pairs]
+
+
+def _map_chunks(func: Callable[[list], list], items: Iterable,
+                workers: Optional[int], chunk_size: int,
+                use_threads: bool) -> Iterator:
+    """
+    Runs func over chunks of items on a pool, yielding results in order.
+
+    Only 2 * workers chunks are in flight at a time, so the input may be
+    an arbitrarily long stream.
+    Args:
+        func (Callable[[list], list]): Function mapping a chunk to results.
+        items (Iterable): The inputs.
+        workers (Optional[int]): Pool size, default os.cpu_count().
+        chunk_size (int): Inputs handed to a worker per task.
+        use_threads (bool): Use threads instead of processes; bcrypt
+            releases the GIL while hashing, so both scale.
+    Returns:
+        Iterator: func's results, one per input, in input order.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    # Deferred: the process pool pulls in multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    executor_class = ThreadPoolExecutor if use_threads \
+        else ProcessPoolExecutor
+    iterator = iter(items)
+    with executor_class(max_workers=workers) as executor:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(islice(iterator, chunk_size))
+                if not chunk:
+                    break
+                pending.append(executor.submit(func, chunk))
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+
+def hash_passwords(passwords: Iterable[str], workers: Optional[int] = None,
+                   chunk_size: int = 8,
+                   use_threads: bool = False) -> Iterator[bytes]:
+    """
+    Hashes many passwords in parallel.
+    Args:
+        passwords (Iterable[str]): The passwords to hash.
+        workers (Optional[int]): Pool size, default os.cpu_count().
+        chunk_size (int): Passwords handed to a worker per task.
+        use_threads (bool): Use a thread pool instead of processes.
+    Returns:
+        Iterator[bytes]: The salted hashes, in input order.
+    """
+    # Resolve the cost here: worker processes don't share a calibration
+    return _map_chunks(partial(_hash_chunk, rounds=get_target_rounds()),
+                       passwords, workers, chunk_size, use_threads)
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]],
+                workers: Optional[int] = None, chunk_size: int = 8,
+                use_threads: bool = False) -> Iterator[bool]:
+    """
+    Validates many (hashed_password, password) pairs in parallel.
+    Args:
+        pairs (Iterable[Tuple[bytes, str]]): Hashes and candidate passwords.
+        workers (Optional[int]): Pool size, default os.cpu_count().
+        chunk_size (int): Pairs handed to a worker per task.
+        use_threads (bool): Use a thread pool instead of processes.
+    Returns:
+        Iterator[bool]: Whether each password matches, in input order.
+    """
+    return _map_chunks(_verify_chunk, pairs, workers, chunk_size,
+                       use_threads)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Time bcrypt costs on this host and pick one.")
+    parser.add_argument("--target-ms", type=float, default=250.0,
+                        help="latency budget per hash (default: 250)")
+    parser.add_argument("--min-rounds", type=int, default=MIN_ROUNDS)
+    parser.add_argument("--max-rounds", type=int, default=MAX_ROUNDS)
+    args = parser.parse_args()
+
+    table = timing_table(args.min_rounds, args.max_rounds,
+                         args.target_ms / 1000.0)
+    print("rounds  ms/hash")
+    for rounds, seconds in table:
+        print("{:>6}  {:>7.1f}".format(rounds, seconds * 1000.0))
+    print("PERSONAL_DATA_BCRYPT_ROUNDS={}".format(
+        _pick_rounds(table, args.target_ms, args.min_rounds)))
@@ -3,18 +3,64 @@
 Module for logging with data redaction and PII filtering.
 """
 
+import atexit
+import json
 import logging
-from typing import List, Tuple
+from collections import Counter
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING, Any, Collection, Dict, Iterator, List, Mapping, Optional,
+    Pattern, Sequence, Tuple)
 import re
 import os
-import mysql.connector
-from mysql.connector import connection
+import sys
+import time
+
+if TYPE_CHECKING:
+    # mysql.connector is heavy; get_db imports it on first use. sqlite3,
+    # hashlib, queue and threading are imported where used too, so
+    # callers that only want filter_datum do not pay for them.
+    from mysql.connector import connection
 
 
 # Define PII fields
 PII_FIELDS: Tuple[str, ...] = ("name", "email", "phone", "ssn", "password")
 
 
+@lru_cache(maxsize=128)
+def _compile_redaction(
+        fields: Tuple[str, ...], separator: str) -> Pattern[str]:
+    """
+    Compiles the redaction pattern for a set of fields once.
+
+    The pattern anchors on the literal "=" and checks the field name with
+    a look-behind, so a match covers only "=value" and can be replaced by
+    a plain string instead of a per-match callback. Patterns are kept in a
+    bounded LRU cache keyed on (fields, separator).
+    Args:
+        fields (Tuple[str, ...]): Field names to obfuscate.
+        separator (str): The character used to separate fields.
+    Returns:
+        Pattern[str]: The compiled redaction pattern.
+    """
+    if not fields:
+        return re.compile(r"(?!)")
+    names = '|'.join(f"(?<={re.escape(field)}=)" for field in fields)
+    return re.compile(f"=(?:{names})[^{re.escape(separator)}]*")
+
+
+@lru_cache(maxsize=32)
+def _redaction_template(redaction: str) -> str:
+    """
+    Builds the literal `re.sub` replacement for a redaction string.
+    Args:
+        redaction (str): String to replace the field values with.
+    Returns:
+        str: "=" followed by the redaction, with backslashes escaped.
+    """
+    return "=" + redaction.replace("\\", r"\\")
+
+
 def filter_datum(
         fields: List[str], redaction: str, message: str, separator: str
 ) -> str:
@@ -28,29 +74,153 @@ def filter_datum(
     Returns:
         str: The obfuscated log message.
     """
-    pattern = '|'.join([f"{field}=[^;]*" for field in fields])
-    return re.sub(
-        pattern, lambda x: f"{x.group().split('=')[0]}={redaction}", message)
+    pattern = _compile_redaction(tuple(fields), separator)
+    return pattern.sub(_redaction_template(redaction), message)
+
+
+class FieldMatcher:
+    """
+    Trie-based field matcher for very large field lists.
+
+    The field names are stored reversed in a trie. For every "=" of a
+    message the text just before it is walked backwards through the trie,
+    which takes at most as many steps as the longest field name whatever
+    the number of fields. A value is redacted exactly when filter_datum
+    would redact it: the key only has to end with a field name, so
+    "username=" matches "name", and every "=" of a token is checked, not
+    just the first one.
+    """
+
+    _END = ""
+
+    def __init__(self, fields: Sequence[str], separator: str = ";"):
+        """
+        Initialize the matcher.
+
+        Args:
+            fields (Sequence[str]): Field names to redact.
+            separator (str): The character used to separate fields.
+        Raises:
+            ValueError: If a field name contains the separator.
+        """
+        self.fields = frozenset(fields)
+        self.separator = separator
+        self._trie: Dict[str, Any] = {}
+        for field in self.fields:
+            if separator in field:
+                raise ValueError(
+                    "field {!r} contains the separator".format(field))
+            node = self._trie
+            for char in reversed(field):
+                node = node.setdefault(char, {})
+            node[self._END] = True
+
+    def _matches(self, text: str, end: int) -> bool:
+        """
+        Checks whether text[:end] ends with one of the fields.
+        Args:
+            text (str): The token being redacted.
+            end (int): Index of the "=" following the key.
+        Returns:
+            bool: True if a field name ends at `end`.
+        """
+        node = self._trie
+        i = end - 1
+        while True:
+            if self._END in node:
+                return True
+            if i < 0:
+                return False
+            node = node.get(text[i])
+            if node is None:
+                return False
+            i -= 1
+
+    def redact(self, message: str, redaction: str) -> str:
+        """
+        Replaces the values of matching keys in a message.
+        Args:
+            message (str): The original log message.
+            redaction (str): String to replace the field values with.
+        Returns:
+            str: The obfuscated log message.
+        """
+        parts = message.split(self.separator)
+        for i, part in enumerate(parts):
+            eq = part.find("=")
+            while eq != -1:
+                if self._matches(part, eq):
+                    parts[i] = part[:eq + 1] + redaction
+                    break
+                eq = part.find("=", eq + 1)
+        return self.separator.join(parts)
 
 
 class RedactingFormatter(logging.Formatter):
     """
     Redacting Formatter class to filter sensitive info in log messages.
+
+    A record whose message is a mapping is redacted by key before any
+    string is built and serialized once, either as the legacy
+    `key=value;` text or as a JSON line. Free-text messages fall back to
+    regex redaction of the formatted line, unless the record is flagged
+    `pre_redacted` by a caller that already redacted it.
     """
 
     REDACTION = "***"
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
+    OUTPUTS = ("text", "json")
+    MATCHERS = ("auto", "regex", "set")
+    # Above this many fields FieldMatcher beats the regex alternation
+    MATCHER_THRESHOLD = 64
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str], output: str = "text",
+                 matcher: str = "auto"):
         """
         Initialize the formatter with specific fields to redact.
 
         Args:
             fields (List[str]): List of field names to redact.
+            output (str): Serialization of structured records, "text" for
+                `key=value;` pairs or "json" for one JSON object per line.
+            matcher (str): How free-text messages are matched: "regex",
+                "set" (FieldMatcher) or "auto", which picks "set" above
+                MATCHER_THRESHOLD fields.
         """
+        if output not in self.OUTPUTS:
+            raise ValueError("output must be one of {}".format(
+                ", ".join(self.OUTPUTS)))
+        if matcher not in self.MATCHERS:
+            raise ValueError("matcher must be one of {}".format(
+                ", ".join(self.MATCHERS)))
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.output = output
+        self._field_set = frozenset(fields)
+        if matcher == "auto":
+            # FieldMatcher cannot match fields spanning the separator
+            matcher = "set" if len(fields) > self.MATCHER_THRESHOLD and \
+                not any(self.SEPARATOR in field for field in fields) \
+                else "regex"
+        self.matcher = matcher
+        if matcher == "set":
+            self._matcher = FieldMatcher(fields, self.SEPARATOR)
+        else:
+            self._pattern = _compile_redaction(tuple(fields), self.SEPARATOR)
+            self._template = _redaction_template(self.REDACTION)
+
+    def redact_text(self, text: str) -> str:
+        """
+        Redacts a free-text message with the configured matcher.
+        Args:
+            text (str): The formatted message.
+        Returns:
+            str: The message with field values replaced.
+        """
+        if self.matcher == "set":
+            return self._matcher.redact(text, self.REDACTION)
+        return self._pattern.sub(self._template, text)
 
     def format(self, record: logging.LogRecord) -> str:
         """
@@ -60,37 +230,307 @@ class RedactingFormatter(logging.Formatter):
         Returns:
             str: The formatted and redacted log message.
         """
+        if isinstance(record.msg, Mapping):
+            return self.format_structured(record)
+        if getattr(record, "pre_redacted", False):
+            # Already redacted by column (see redact_rows)
+            return super().format(record)
         original_message = super().format(record)
-        return filter_datum(
-            self.fields, self.REDACTION, original_message, self.SEPARATOR)
+        return self.redact_text(original_message)
+
+    def redact_mapping(self, data: Mapping[str, Any]) -> Dict[str, Any]:
+        """
+        Redacts the values of PII keys by lookup.
+        Args:
+            data (Mapping[str, Any]): Field names and values.
+        Returns:
+            Dict[str, Any]: A copy with PII values replaced.
+        """
+        fields, redaction = self._field_set, self.REDACTION
+        return {key: redaction if key in fields else value
+                for key, value in data.items()}
+
+    def format_structured(self, record: logging.LogRecord) -> str:
+        """
+        Format a record whose message is a mapping of fields.
+        Args:
+            record (logging.LogRecord): The log record to format.
+        Returns:
+            str: The formatted line with PII values redacted.
+        """
+        data = self.redact_mapping(record.msg)
+        record.asctime = self.formatTime(record, self.datefmt)
+
+        # Tracebacks are free text, so they still go through the regex
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        exc_text = None
+        if record.exc_text:
+            exc_text = self.redact_text(record.exc_text)
+
+        if self.output == "json":
+            entry = {
+                "name": record.name,
+                "levelname": record.levelname,
+                "asctime": record.asctime,
+                "fields": data,
+            }
+            if exc_text:
+                entry["exc_text"] = exc_text
+            return json.dumps(entry, default=str)
 
+        separator = self.SEPARATOR
+        record.message = "".join(
+            [f"{key}={value}{separator}" for key, value in data.items()])
+        line = self.formatMessage(record)
+        if exc_text:
+            line += "\n" + exc_text
+        return line
 
-def get_logger() -> logging.Logger:
+
+def _write_batch(
+        handler: logging.Handler, records: List[logging.LogRecord]) -> None:
+    """
+    Formats records and writes them to a stream handler in one call.
+
+    Records go through the handler's level and filters, as handle() would
+    put them. Handlers without a stream are handed each record instead.
+    Args:
+        handler (logging.Handler): The handler receiving the batch.
+        records (List[logging.LogRecord]): The records to emit.
+    """
+    stream = getattr(handler, "stream", None)
+    if stream is None:
+        for record in records:
+            handler.handle(record)
+        return
+    lines = [handler.format(record) for record in records
+             if record.levelno >= handler.level and handler.filter(record)]
+    if not lines:
+        return
+    handler.acquire()
+    try:
+        stream.write(handler.terminator.join(lines) + handler.terminator)
+        handler.flush()
+    finally:
+        handler.release()
+
+
+class AsyncBatchHandler(logging.Handler):
+    """
+    Handler that queues records and emits them from a background thread.
+
+    Callers only pay for an enqueue; formatting, redaction and the write
+    happen on the listener thread, which drains up to `batch_size` records
+    at a time into the target handler with a single write.
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop", "count")
+
+    def __init__(self, target: logging.Handler, maxsize: int = 10000,
+                 overflow: str = "block", batch_size: int = 256):
+        """
+        Initialize the handler and start its listener thread.
+
+        Args:
+            target (logging.Handler): Handler that formats and writes.
+            maxsize (int): Capacity of the record queue.
+            overflow (str): What to do when the queue is full: "block"
+                waits for room, "drop" discards the record silently and
+                "count" discards it and reports the tally on the next write.
+            batch_size (int): Maximum records written per batch.
+        """
+        import queue
+        import threading
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(
+                ", ".join(self.OVERFLOW_POLICIES)))
+        super().__init__()
+        self.target = target
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._reported = 0
+        # Producers bump `dropped` concurrently with the listener reading it
+        self._dropped_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize)
+        self._full = queue.Full
+        self._thread = threading.Thread(
+            target=self._listen, name="user_data-log-listener", daemon=True)
+        self._thread.start()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Makes a record safe to hand to another thread.
+
+        The message is merged with its args (or a structured message
+        copied) and any traceback rendered now, since both may change or
+        disappear once the caller moves on.
+        Args:
+            record (logging.LogRecord): The record being logged.
+        Returns:
+            logging.LogRecord: The same record, self-contained.
+        """
+        if isinstance(record.msg, Mapping):
+            record.msg = dict(record.msg)
+        else:
+            record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """
+        Enqueues a record, applying the overflow policy when full.
+        Args:
+            record (logging.LogRecord): The record being logged.
+        """
+        try:
+            record = self.prepare(record)
+            if self.overflow == "block":
+                self._queue.put(record)
+            else:
+                self._queue.put_nowait(record)
+        except self._full:
+            if self.overflow == "count":
+                with self._dropped_lock:
+                    self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _listen(self) -> None:
+        """
+        Listener loop: drains the queue in batches until a stop sentinel.
+        """
+        import queue
+        q = self._queue
+        while True:
+            batch = [q.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            records = [record for record in batch if record is not None]
+            if self.dropped != self._reported:
+                records.append(self._dropped_notice())
+            try:
+                if records:
+                    _write_batch(self.target, records)
+            except Exception:
+                for record in records:
+                    self.handleError(record)
+            finally:
+                for _ in batch:
+                    q.task_done()
+            if stop:
+                return
+
+    def _dropped_notice(self) -> logging.LogRecord:
+        """
+        Builds a record reporting how many records overflowed.
+        """
+        with self._dropped_lock:
+            dropped = self.dropped
+        count, self._reported = dropped - self._reported, dropped
+        return logging.makeLogRecord({
+            "name": "user_data", "levelno": logging.WARNING,
+            "levelname": "WARNING",
+            "msg": "{} log records dropped: queue full".format(count)})
+
+    def flush(self) -> None:
+        """
+        Blocks until every queued record has been written.
+        """
+        if self._thread.is_alive():
+            self._queue.join()
+        self.target.flush()
+
+    def close(self) -> None:
+        """
+        Flushes, stops the listener thread and closes the target.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self.target.close()
+        super().close()
+
+
+def get_logger(asynchronous: Optional[bool] = None) -> logging.Logger:
     """
     Creates a logger for user data with sensitive information redacted.
 
+    The logger is configured once, by the first call; later calls return
+    it unchanged. In asynchronous mode records are queued and written by
+    a background thread. The mode defaults to PERSONAL_DATA_LOG_ASYNC,
+    with the queue tuned by PERSONAL_DATA_LOG_QUEUE_SIZE (10000) and
+    PERSONAL_DATA_LOG_OVERFLOW ("block", "drop" or "count").
+    PERSONAL_DATA_LOG_OUTPUT selects "text" or "json" for structured
+    records.
+
+    Args:
+        asynchronous (Optional[bool]): Whether to enable the queued mode.
     Returns:
         logging.Logger: Configured logger with a redacting formatter.
+    Raises:
+        ValueError: If `asynchronous` is given and the logger is already
+            configured in the other mode.
     """
     # Create logger
     logger = logging.getLogger("user_data")
+    if logger.handlers:
+        configured = any(isinstance(handler, AsyncBatchHandler)
+                         for handler in logger.handlers)
+        if asynchronous is not None and asynchronous != configured:
+            raise ValueError(
+                "user_data logger is already configured {}".format(
+                    "asynchronous" if configured else "synchronous"))
+        return logger
     logger.setLevel(logging.INFO)
     logger.propagate = False
 
     # Set up stream handler with redacting formatter
     stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
-    logger.addHandler(stream_handler)
+    stream_handler.setFormatter(RedactingFormatter(
+        PII_FIELDS, output=os.getenv("PERSONAL_DATA_LOG_OUTPUT", "text")))
+
+    if asynchronous is None:
+        asynchronous = os.getenv("PERSONAL_DATA_LOG_ASYNC", "0") == "1"
+    if not asynchronous:
+        logger.addHandler(stream_handler)
+        return logger
 
+    handler = AsyncBatchHandler(
+        stream_handler,
+        maxsize=int(os.getenv("PERSONAL_DATA_LOG_QUEUE_SIZE", "10000")),
+        overflow=os.getenv("PERSONAL_DATA_LOG_OVERFLOW", "block"))
+    logger.addHandler(handler)
+    atexit.register(handler.close)
     return logger
 
 
-def get_db() -> connection.MySQLConnection:
+def get_db() -> "connection.MySQLConnection":
     """
     Connect to the MySQL database using environment variables for credentials.
+
+    If PERSONAL_DATA_DB_SQLITE is set, a SQLite database at that path is
+    opened instead so the export can run where MySQL isn't available.
+    Every call opens a new connection: this is the factory of the
+    db_pool.get_pool pool, which the export borrows connections from.
     Returns:
         connection.MySQLConnection: A connector to the MySQL database.
     """
+    # A local SQLite file stands in for MySQL when configured
+    sqlite_path = os.getenv("PERSONAL_DATA_DB_SQLITE")
+    if sqlite_path:
+        import sqlite3
+        return sqlite3.connect(sqlite_path, check_same_thread=False)
+
     # Retrieve environment variables with defaults where applicable
     username = os.getenv("PERSONAL_DATA_DB_USERNAME", "root")
     password = os.getenv("PERSONAL_DATA_DB_PASSWORD", "")
@@ -98,6 +538,7 @@ def get_db() -> connection.MySQLConnection:
     database = os.getenv("PERSONAL_DATA_DB_NAME")
 
     # Connect to the database
+    import mysql.connector
     return mysql.connector.connect(
         user=username,
         password=password,
@@ -105,34 +546,350 @@ def get_db() -> connection.MySQLConnection:
         database=database
     )
 
+
+def _open_cursor(db):
+    """
+    Opens an unbuffered cursor so rows stay on the server until fetched.
+    Args:
+        db: A MySQL or SQLite connection.
+    Returns:
+        A DB-API cursor.
+    """
+    try:
+        return db.cursor(buffered=False)
+    except TypeError:
+        # sqlite3 cursors are always lazy and take no options
+        return db.cursor()
+
+
+def stream_rows(cursor, batch_size: int) -> Iterator[Sequence[tuple]]:
+    """
+    Yields the rows of an executed query in batches of `batch_size`.
+    Args:
+        cursor: A DB-API cursor on which a query was executed.
+        batch_size (int): Number of rows fetched per round trip.
+    Returns:
+        Iterator[Sequence[tuple]]: The row batches.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def pii_columns(columns: Sequence[str],
+                fields: Sequence[str] = PII_FIELDS) -> List[int]:
+    """
+    Returns the indexes of the columns the redaction regex would hit.
+
+    Like the regex look-behind, a column matches when its name ends with
+    a field name (so "username" matches "name").
+    Args:
+        columns (Sequence[str]): Column names, e.g. from cursor.description.
+        fields (Sequence[str]): Field names to redact.
+    Returns:
+        List[int]: Indexes of the columns to redact.
+    """
+    return [i for i, column in enumerate(columns)
+            if any(column.endswith(field) for field in fields)]
+
+
+def redact_rows(columns: Sequence[str], rows: Sequence[tuple],
+                fields: Sequence[str] = PII_FIELDS,
+                redaction: str = RedactingFormatter.REDACTION,
+                separator: str = RedactingFormatter.SEPARATOR) -> List[str]:
+    """
+    Builds redacted `col=val; ...;` messages for a batch of rows.
+
+    PII column indexes are worked out once for the whole batch and their
+    values swapped while the message is built, so no regex runs. Rows
+    with a "=" in a value also go through filter_datum afterwards, to
+    catch key=value pairs embedded in other columns. A PII value is
+    always redacted whole, even if it contains the separator.
+    Args:
+        columns (Sequence[str]): Column names of the rows.
+        rows (Sequence[tuple]): The rows.
+        fields (Sequence[str]): Field names to redact.
+        redaction (str): String to replace the field values with.
+        separator (str): The character separating fields.
+    Returns:
+        List[str]: One message per row.
+    """
+    pii = pii_columns(columns, fields)
+    prefixes = [f"{column}=" for column in columns]
+    messages = []
+    for row in rows:
+        values = [f"{value}" for value in row]
+        for i in pii:
+            if i < len(values):
+                values[i] = redaction
+        message = "; ".join([p + v for p, v in zip(prefixes, values)]) + ";"
+        if any("=" in value for value in values):
+            message = filter_datum(fields, redaction, message, separator)
+        messages.append(message)
+    return messages
+
+
+def _emit_batch(logger: logging.Logger, messages: List[str],
+                pre_redacted: bool = False) -> None:
+    """
+    Formats a batch of messages and hands them to each handler at once.
+
+    Args:
+        logger (logging.Logger): The logger whose handlers receive the batch.
+        messages (List[str]): Log messages.
+        pre_redacted (bool): Whether the messages are already redacted, in
+            which case RedactingFormatter skips its regex pass.
+    """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    extra = {"pre_redacted": True} if pre_redacted else None
+    records = [logger.makeRecord(logger.name, logging.INFO, __file__, 0,
+                                 message, None, None, extra=extra)
+               for message in messages]
+    for handler in logger.handlers:
+        _write_batch(handler, records)
+
+
+def _peak_rss_kb() -> int:
+    """
+    Returns the peak resident set size of this process in kilobytes.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def row_digest(row: tuple) -> str:
+    """
+    Fingerprint of a row, used to recognize rows already exported without
+    keeping their values.
+    Args:
+        row (tuple): A row as returned by the cursor.
+    Returns:
+        str: The hex SHA-256 digest of the row.
+    """
+    import hashlib
+    return hashlib.sha256(repr(row).encode()).hexdigest()
+
+
+def export_users(db, logger: logging.Logger, batch_size: int = 1000,
+                 query: str = "SELECT * FROM users;",
+                 fields: Sequence[str] = PII_FIELDS, params: Sequence = (),
+                 watermark_column: Optional[str] = None,
+                 after: Optional[str] = None,
+                 seen: Collection[str] = ()) -> Dict[str, Any]:
+    """
+    Streams the rows of `query` through the logger in batches.
+
+    Rows are fetched with fetchmany from an unbuffered cursor, redacted by
+    column with redact_rows and written once per batch, so memory stays
+    flat however large the table is.
+    Args:
+        db: A MySQL or SQLite connection, or None to borrow one from the
+            process-wide pool of db_pool.get_pool.
+        logger (logging.Logger): The logger used to emit rows.
+        batch_size (int): Number of rows fetched and written per batch.
+        query (str): The query selecting the rows to export.
+        fields (Sequence[str]): Column names to redact.
+        params (Sequence): Parameters bound to the query.
+        watermark_column (Optional[str]): Column whose highest value seen
+            is returned as "watermark".
+        after (Optional[str]): The watermark of an earlier export.
+        seen (Collection[str]): Digests of the rows the earlier export
+            had at `after`; rows at `after` matching one are skipped.
+    Returns:
+        Dict[str, Any]: rows, seconds, rows_per_sec, peak_rss_kb,
+        watermark (None unless watermark_column is given and rows seen) and
+        seen, the row_digest of every row at the watermark.
+    """
+    if db is None:
+        from db_pool import get_pool
+        with get_pool().connection() as db:
+            return export_users(db, logger, batch_size, query, fields,
+                                params, watermark_column, after, seen)
+    start = time.perf_counter()
+    count = 0
+    watermark = None
+    at_watermark: List[str] = []
+    skip = Counter(seen)
+    cursor = _open_cursor(db)
+    try:
+        if params:
+            cursor.execute(query, tuple(params))
+        else:
+            cursor.execute(query)
+
+        # Column names for building log messages
+        columns = [desc[0] for desc in cursor.description]
+        mark = columns.index(watermark_column) if watermark_column else None
+
+        for rows in stream_rows(cursor, batch_size):
+            if mark is not None:
+                top = max((row[mark] for row in rows
+                           if row[mark] is not None), default=None)
+                if top is not None and (watermark is None or
+                                        top >= watermark):
+                    if watermark is None or top > watermark:
+                        watermark, at_watermark = top, []
+                    at_watermark.extend(row_digest(row) for row in rows
+                                        if row[mark] == top)
+                if skip:
+                    rows = [row for row in rows
+                            if not _skip_seen(row, mark, after, skip)]
+            _emit_batch(logger, redact_rows(columns, rows, fields),
+                        pre_redacted=True)
+            count += len(rows)
+    finally:
+        cursor.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": count,
+        "seconds": elapsed,
+        "rows_per_sec": count / elapsed if elapsed else 0.0,
+        "peak_rss_kb": _peak_rss_kb(),
+        "watermark": watermark,
+        "seen": at_watermark,
+    }
+
+
+def _skip_seen(row: tuple, mark: int, after: Optional[str],
+               skip: Counter) -> bool:
+    """
+    Returns True, once per digest in `skip`, for a row exported by the
+    earlier run whose watermark was `after`.
+    """
+    if row[mark] is None or str(row[mark]) != after:
+        return False
+    digest = row_digest(row)
+    if not skip[digest]:
+        return False
+    skip[digest] -= 1
+    if not skip[digest]:
+        del skip[digest]
+    return True
+
+
+def load_watermark(state_path: str) -> Tuple[Optional[str], List[str]]:
+    """
+    Reads the last exported `last_login` from the state file.
+    Args:
+        state_path (str): Path of the JSON state file.
+    Returns:
+        Tuple[Optional[str], List[str]]: The watermark, or None if there is
+        no state yet, and the digests of the rows exported at it.
+    """
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None, []
+    return state.get("last_login"), state.get("seen", [])
+
+
+def save_watermark(state_path: str, watermark: str,
+                   seen: Sequence[str] = ()) -> None:
+    """
+    Atomically stores the watermark in the state file.
+    Args:
+        state_path (str): Path of the JSON state file.
+        watermark (str): The highest `last_login` exported.
+        seen (Sequence[str]): Digests of the rows exported at watermark.
+    """
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"last_login": watermark, "seen": list(seen)}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, state_path)
+
+
+def export_users_incremental(db, logger: logging.Logger, state_path: str,
+                             batch_size: int = 1000,
+                             full: bool = False) -> Dict[str, Any]:
+    """
+    Exports only the users whose last_login is past the stored watermark.
+
+    The range query on last_login is served by the
+    idx_users_last_login index. It starts at the watermark itself, since
+    users can share a last_login, and skips the rows the previous run
+    exported there, recognized by the row_digest kept in the state file;
+    the table has no key to order ties by. The watermark is saved only
+    once the export has completed, so a failed run is simply retried.
+    Rows with a NULL last_login are only exported by a full resync.
+    Args:
+        db: A MySQL or SQLite connection, or None to borrow one from the
+            process-wide pool of db_pool.get_pool.
+        logger (logging.Logger): The logger used to emit rows.
+        state_path (str): Path of the JSON state file.
+        batch_size (int): Number of rows fetched and written per batch.
+        full (bool): Ignore the watermark and export every row.
+    Returns:
+        Dict[str, Any]: The export_users statistics.
+    """
+    if db is None:
+        from db_pool import get_pool
+        with get_pool().connection() as db:
+            return export_users_incremental(db, logger, state_path,
+                                            batch_size, full)
+    watermark, seen = (None, []) if full else load_watermark(state_path)
+    if watermark is None:
+        query, params = "SELECT * FROM users ORDER BY last_login;", ()
+    else:
+        import sqlite3
+        placeholder = "?" if isinstance(db, sqlite3.Connection) else "%s"
+        query = ("SELECT * FROM users WHERE last_login >= {} "
+                 "ORDER BY last_login;").format(placeholder)
+        params = (watermark,)
+
+    stats = export_users(db, logger, batch_size, query, params=params,
+                         watermark_column="last_login", after=watermark,
+                         seen=seen)
+    if stats["watermark"] is not None:
+        save_watermark(state_path, str(stats["watermark"]), stats["seen"])
+    return stats
+
+
 def main():
     """
     Main function that retrieves all rows from the 'users' table and logs them
     with sensitive information redacted.
+
+    Rows are streamed in batches of PERSONAL_DATA_EXPORT_BATCH_SIZE
+    (default 1000); throughput and peak RSS are reported on stderr.
+    If PERSONAL_DATA_EXPORT_STATE names a state file, only rows past the
+    stored last_login watermark are exported; PERSONAL_DATA_EXPORT_FULL=1
+    forces a full resync. The connection is borrowed from the pool of
+    db_pool.get_pool, configured by the PERSONAL_DATA_DB_POOL_* variables.
     """
+    from db_pool import get_pool
+
     # Get the logger
     logger = get_logger()
+    batch_size = int(os.getenv("PERSONAL_DATA_EXPORT_BATCH_SIZE", "1000"))
+    state_path = os.getenv("PERSONAL_DATA_EXPORT_STATE")
 
-    # Connect to the database
-    db = get_db()
-    cursor = db.cursor()
-
-    # Query to retrieve all rows from the users table
-    query = "SELECT * FROM users;"
-    cursor.execute(query)
-
-    # Column names for building log messages
-    columns = [desc[0] for desc in cursor.description]
-
-    # Fetch all rows and log each row
-    for row in cursor.fetchall():
-        row_data = "; ".join(
-            [f"{col}={val}" for col, val in zip(columns, row)]) + ";"
-        logger.info(row_data)
+    # Borrow a pooled connection for the export
+    try:
+        if state_path:
+            stats = export_users_incremental(
+                None, logger, state_path, batch_size,
+                full=os.getenv("PERSONAL_DATA_EXPORT_FULL", "0") == "1")
+        else:
+            stats = export_users(None, logger, batch_size)
+    finally:
+        # Close the pooled connections
+        get_pool().close()
 
-    # Close database connection
-    cursor.close()
-    db.close()
+    print("exported {rows} rows in {seconds:.2f}s ({rows_per_sec:,.0f} "
+          "rows/s), peak RSS {peak_rss_kb} KB".format(**stats),
+          file=sys.stderr)
 
 
 # Only run the main function if this module is executed directly
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+AsyncBatchHandler counts every dropped record and honours filters.
+"""
+import io
+import logging
+import re
+import threading
+import unittest
+
+from filtered_logger import AsyncBatchHandler, RedactingFormatter
+
+
+class TestAsyncBatchHandler(unittest.TestCase):
+    """Records written through an AsyncBatchHandler."""
+
+    def make(self, **kwargs):
+        """A handler writing to a string through a redacting formatter."""
+        target = logging.StreamHandler(io.StringIO())
+        target.setFormatter(RedactingFormatter(["name"]))
+        handler = AsyncBatchHandler(target, **kwargs)
+        self.addCleanup(handler.close)
+        return target, handler
+
+    def record(self, msg):
+        """An INFO record."""
+        return logging.makeLogRecord({"msg": msg, "levelno": logging.INFO,
+                                      "levelname": "INFO"})
+
+    def test_dropped_count(self):
+        """Written plus reported dropped records add up to those sent."""
+        target, handler = self.make(maxsize=4, overflow="count")
+
+        def produce():
+            for _ in range(2000):
+                handler.emit(self.record("name=bob;"))
+
+        threads = [threading.Thread(target=produce) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        handler.emit(self.record("last"))
+        handler.flush()
+        output = target.stream.getvalue()
+        written = output.count("name=***;") + output.count("last")
+        reported = sum(int(n) for n in re.findall(
+            r"(\d+) log records dropped", output))
+        self.assertEqual(handler.dropped, reported)
+        self.assertEqual(written + reported, 8 * 2000 + 1)
+
+    def test_target_filters(self):
+        """Filters of the wrapped stream handler apply to batches."""
+        target, handler = self.make()
+        target.addFilter(lambda record: "secret" not in record.getMessage())
+        for msg in ("keep", "secret", "also kept"):
+            handler.emit(self.record(msg))
+        handler.flush()
+        output = target.stream.getvalue()
+        self.assertIn("keep", output)
+        self.assertIn("also kept", output)
+        self.assertNotIn("secret", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
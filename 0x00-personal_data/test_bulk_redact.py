@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+bulk_redact redacts the columns the export path redacts, in order.
+"""
+import csv
+import os
+import tempfile
+import unittest
+
+from bulk_redact import bulk_redact
+from filtered_logger import redact_rows
+
+HEADER = ["user_name", "user_email", "phone", "ssn", "password", "ip",
+          "last_login", "user_agent"]
+
+
+class TestBulkRedact(unittest.TestCase):
+    """bulk_redact against redact_rows."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.dir.name, "in.csv")
+        self.dst = os.path.join(self.dir.name, "out.csv")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def redact(self, text: str) -> str:
+        """Runs bulk_redact over text in small chunks on two workers."""
+        with open(self.src, "w", newline="") as f:
+            f.write(text)
+        bulk_redact(self.src, self.dst, workers=2, chunk_size=64)
+        with open(self.dst, newline="") as f:
+            return f.read()
+
+    def test_same_as_export(self):
+        """Rows come out in order, redacted like redact_rows does."""
+        rows = [["n{}".format(i), "u{}@x.io".format(i), "555", "1", "pw",
+                 "10.0.0.{}".format(i), "2019-11-14 06:14:24", "a, b"]
+                for i in range(50)]
+        lines = [",".join(HEADER)] + [",".join(
+            '"{}"'.format(v) if "," in v else v for v in row)
+            for row in rows]
+        output = list(csv.reader(
+            self.redact("\n".join(lines) + "\n").splitlines()))
+        self.assertEqual(output[0], HEADER)
+        self.assertEqual(
+            ["; ".join("{}={}".format(c, v) for c, v in zip(HEADER, row))
+             + ";" for row in output[1:]],
+            redact_rows(HEADER, rows))
+
+    def test_keeps_dialect(self):
+        """Quoting, delimiter and line endings of the input are kept."""
+        text = ("name;email;ip\r\n"
+                '"Bob";bob@x.io;"1.2.3.4"\r\n'
+                'Ann;"ann@x.io";1.2.3.5\r\n'
+                'Eve;eve"@x.io;"5;6"\r\n'
+                "Short\r\n")
+        self.assertEqual(self.redact(text), (
+            "name;email;ip\r\n"
+            '"***";***;"1.2.3.4"\r\n'
+            '***;"***";1.2.3.5\r\n'
+            '***;***;"5;6"\r\n'
+            "***\r\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
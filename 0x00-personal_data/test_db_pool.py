@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+ConnectionPool against SQLite: checkout, waiting, replacement and release.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeout
+from filtered_logger import export_users
+from users_sqlite import build_users_db
+
+CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                   "user_data.csv")
+
+
+def memory_db():
+    """A new in-memory SQLite connection."""
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+
+class BrokenRollback:
+    """A connection whose rollback fails."""
+
+    def __init__(self):
+        self.closed = False
+
+    def rollback(self):
+        raise sqlite3.OperationalError("connection lost")
+
+    def close(self):
+        self.closed = True
+
+
+class TestCheckout(unittest.TestCase):
+    """ConnectionPool.acquire."""
+
+    def test_timeout(self):
+        """A full pool raises PoolTimeout once the timeout expires."""
+        pool = ConnectionPool(memory_db, size=1, timeout=0.05)
+        conn = pool.acquire()
+        start = time.monotonic()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(pool.metrics["timeouts"], 1)
+        self.assertEqual(pool.metrics["waits"], 1)
+        pool.release(conn)
+        pool.close()
+
+    def test_wait_for_release(self):
+        """A waiting checkout gets the connection released meanwhile."""
+        pool = ConnectionPool(memory_db, size=1)
+        conn = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, (conn,))
+        timer.start()
+        self.assertIs(pool.acquire(timeout=5), conn)
+        timer.join()
+        self.assertEqual(pool.metrics["waits"], 1)
+        self.assertEqual(pool.metrics["creations"], 1)
+        pool.close()
+
+    def test_recycle(self):
+        """A connection older than `recycle` is closed and replaced."""
+        pool = ConnectionPool(memory_db, size=1, recycle=0.01)
+        conn = pool.acquire()
+        pool.release(conn)
+        time.sleep(0.02)
+        fresh = pool.acquire()
+        self.assertIsNot(fresh, conn)
+        self.assertEqual(pool.metrics["recycled"], 1)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+        fresh.execute("SELECT 1")
+        pool.release(fresh)
+        pool.close()
+
+    def test_failed_pre_ping(self):
+        """A connection failing `SELECT 1` is replaced in its slot."""
+        pool = ConnectionPool(memory_db, size=1)
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.close()
+        fresh = pool.acquire(timeout=0)
+        self.assertIsNot(fresh, conn)
+        self.assertEqual(pool.metrics["ping_failures"], 1)
+        self.assertEqual(pool.metrics["creations"], 2)
+        fresh.execute("SELECT 1")
+        pool.release(fresh)
+        pool.close()
+
+
+class TestRelease(unittest.TestCase):
+    """ConnectionPool.release."""
+
+    def test_rolls_back_open_transaction(self):
+        """Uncommitted writes do not reach the next borrower."""
+        pool = ConnectionPool(memory_db, size=1)
+        with pool.connection() as conn:
+            conn.execute("CREATE TABLE t (x)")
+            conn.commit()
+            conn.execute("INSERT INTO t VALUES (1)")
+            self.assertTrue(conn.in_transaction)
+        with pool.connection() as conn:
+            self.assertFalse(conn.in_transaction)
+            self.assertEqual(
+                conn.execute("SELECT COUNT(*) FROM t").fetchone(), (0,))
+        pool.close()
+
+    def test_failed_rollback_discards(self):
+        """A connection that cannot roll back is closed, not pooled."""
+        pool = ConnectionPool(BrokenRollback, size=1, pre_ping=False)
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.metrics["reset_failures"], 1)
+        self.assertIsNot(pool.acquire(timeout=0), conn)
+
+    def test_double_and_unknown_release(self):
+        """Releasing twice or a foreign connection raises ValueError."""
+        pool = ConnectionPool(memory_db, size=2)
+        conn = pool.acquire()
+        pool.release(conn)
+        with self.assertRaises(ValueError):
+            pool.release(conn)
+        with self.assertRaises(ValueError):
+            pool.release(memory_db())
+        self.assertEqual(len(pool._idle), 1)
+        self.assertEqual(pool.metrics["checkins"], 1)
+        pool.close()
+
+
+class TestExportPool(unittest.TestCase):
+    """export_users without a connection uses the process pool."""
+
+    def test_export_reuses_pooled_connection(self):
+        """Two exports open a single SQLite connection."""
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "users.db")
+            rows = build_users_db(db_path, CSV)
+            logger = logging.getLogger("test_db_pool")
+            logger.addHandler(logging.NullHandler())
+            logger.propagate = False
+            env = {"PERSONAL_DATA_DB_SQLITE": db_path}
+            with mock.patch.dict(os.environ, env), \
+                    mock.patch.object(db_pool, "_pool", None):
+                for _ in range(2):
+                    self.assertEqual(
+                        export_users(None, logger)["rows"], rows)
+                pool = db_pool.get_pool()
+                self.assertEqual(pool.metrics["creations"], 1)
+                self.assertEqual(pool.metrics["checkouts"], 2)
+                pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
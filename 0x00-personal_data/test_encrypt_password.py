@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Rehashing only raises the bcrypt cost, and logins never calibrate.
+"""
+import os
+import unittest
+from unittest import mock
+
+import encrypt_password
+from encrypt_password import (
+    DEFAULT_ROUNDS, calibrate_target_rounds, get_target_rounds,
+    hash_password, is_valid, needs_rehash)
+
+
+class TestRounds(unittest.TestCase):
+    """Target cost and rehash decisions."""
+
+    def setUp(self):
+        """No fixed cost and no calibration."""
+        env = mock.patch.dict(os.environ)
+        env.start()
+        self.addCleanup(env.stop)
+        os.environ.pop("PERSONAL_DATA_BCRYPT_ROUNDS", None)
+        os.environ["PERSONAL_DATA_BCRYPT_TARGET_MS"] = "1"
+        target = mock.patch.object(encrypt_password, "_target_rounds", None)
+        target.start()
+        self.addCleanup(target.stop)
+
+    def test_only_weaker_hashes_need_rehash(self):
+        """A hash above the target is kept, one below is redone."""
+        os.environ["PERSONAL_DATA_BCRYPT_ROUNDS"] = "5"
+        self.assertFalse(needs_rehash(hash_password("pw", 6)))
+        self.assertFalse(needs_rehash(hash_password("pw", 5)))
+        self.assertTrue(needs_rehash(hash_password("pw", 4)))
+
+    def test_login_does_not_calibrate(self):
+        """is_valid uses the default cost until calibration runs."""
+        hashed = hash_password("pw", 4)
+        outdated = []
+        with mock.patch.object(encrypt_password, "calibrate_rounds",
+                               side_effect=AssertionError("calibrated")):
+            self.assertTrue(is_valid(hashed, "pw",
+                                     lambda h, p: outdated.append(h)))
+        self.assertEqual(get_target_rounds(), DEFAULT_ROUNDS)
+        self.assertEqual(outdated, [hashed])
+
+    def test_explicit_calibration(self):
+        """calibrate_target_rounds sets the cost get_target_rounds gives."""
+        with mock.patch.object(encrypt_password, "calibrate_rounds",
+                               return_value=11) as calibrate:
+            self.assertEqual(calibrate_target_rounds(), 11)
+        calibrate.assert_called_once_with(1.0)
+        self.assertEqual(get_target_rounds(), 11)
+        os.environ["PERSONAL_DATA_BCRYPT_ROUNDS"] = "13"
+        self.assertEqual(get_target_rounds(), 13)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+export_users_incremental exports every row exactly once.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from filtered_logger import export_users_incremental
+from users_sqlite import build_users_db
+
+CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                   "user_data.csv")
+LAST_LOGIN = "2019-11-14 06:16:24"
+
+
+class Collect(logging.Handler):
+    """Keeps the messages it is handed."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestExportIncremental(unittest.TestCase):
+    """Runs of export_users_incremental against the SQLite users table."""
+
+    def setUp(self):
+        """A users table built from user_data.csv and an empty state."""
+        self.dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.dir.name, "users.db")
+        self.rows = build_users_db(db_path, CSV)
+        self.db = sqlite3.connect(db_path)
+        self.state = os.path.join(self.dir.name, "state.json")
+        self.handler = Collect()
+        self.logger = logging.getLogger("test_export_incremental")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.db.close()
+        self.dir.cleanup()
+
+    def export(self, full=False):
+        """Runs an export; returns the ip column of the rows emitted."""
+        self.handler.messages = []
+        export_users_incremental(self.db, self.logger, self.state,
+                                 batch_size=5, full=full)
+        return [message.split("ip=")[1].split(";")[0]
+                for message in self.handler.messages]
+
+    def insert(self, ip, last_login):
+        """Adds a user."""
+        self.db.execute(
+            "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+            ("Ann", "ann@x.io", "555", "1", "pw", ip, last_login, "ua"))
+        self.db.commit()
+
+    def test_first_run_and_rerun(self):
+        """The first run exports the table, a rerun nothing."""
+        self.assertEqual(len(self.export()), self.rows)
+        self.assertEqual(self.export(), [])
+
+    def test_new_row(self):
+        """Only a row past the watermark is exported."""
+        self.export()
+        self.insert("10.0.0.1", "2019-11-14 07:00:00")
+        self.assertEqual(self.export(), ["10.0.0.1"])
+        self.assertEqual(self.export(), [])
+
+    def test_tie_at_watermark(self):
+        """Rows sharing the watermark are exported once each."""
+        self.export()
+        self.insert("10.0.0.1", LAST_LOGIN)
+        self.assertEqual(self.export(), ["10.0.0.1"])
+        self.insert("10.0.0.2", LAST_LOGIN)
+        self.insert("10.0.0.2", LAST_LOGIN)
+        self.assertEqual(self.export(), ["10.0.0.2", "10.0.0.2"])
+        self.assertEqual(self.export(), [])
+
+    def test_full(self):
+        """full=True exports every row again."""
+        self.export()
+        self.insert("10.0.0.1", LAST_LOGIN)
+        self.assertEqual(len(self.export(full=True)), self.rows + 1)
+        self.assertEqual(self.export(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
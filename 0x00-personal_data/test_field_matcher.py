@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+FieldMatcher must redact exactly what filter_datum redacts.
+"""
+import random
+import unittest
+
+from filtered_logger import FieldMatcher, RedactingFormatter, filter_datum
+
+
+class TestFieldMatcher(unittest.TestCase):
+    """FieldMatcher against the regex of filter_datum."""
+
+    FIELDS = ["name", "email", "phone", "ssn", "password"] + [
+        "field{}".format(i) for i in range(100)]
+
+    def assertSameAsRegex(self, fields, message, separator=";"):
+        """Both matchers give the same output for a message."""
+        self.assertEqual(
+            FieldMatcher(fields, separator).redact(message, "***"),
+            filter_datum(fields, "***", message, separator))
+
+    def test_reported_leaks(self):
+        """Values the first version of FieldMatcher left in clear."""
+        for message in ("msg=login, email=a@b.c;", "user:name=bob;",
+                        "username=bob;", "a=1 b=2 password=x=y;ssn=1"):
+            self.assertSameAsRegex(self.FIELDS, message)
+        self.assertEqual(
+            FieldMatcher(self.FIELDS).redact(
+                "msg=login, email=a@b.c;user:name=bob;", "***"),
+            "msg=login, email=***;user:name=***;")
+
+    def test_empty_and_edge_fields(self):
+        """No fields, an empty field name and keys at the token start."""
+        for fields in ([], [""], ["a"], ["name", "ame", "e"]):
+            for message in ("", "=", "==x;", "name=1;=2;a=3", "x;y=;z"):
+                self.assertSameAsRegex(fields, message)
+
+    def test_random_messages(self):
+        """Random messages built from fields, noise and separators."""
+        rand = random.Random(0)
+        pieces = self.FIELDS[:8] + ["user", "x", " ", "=", ";", ",", ":",
+                                    "@", "bob", "field1", "1"]
+        for _ in range(5000):
+            message = "".join(rand.choice(pieces)
+                              for _ in range(rand.randint(0, 12)))
+            self.assertSameAsRegex(self.FIELDS, message)
+
+    def test_separator_in_field(self):
+        """Such fields are rejected, and "auto" keeps the regex."""
+        with self.assertRaises(ValueError):
+            FieldMatcher(["a;b"], ";")
+        formatter = RedactingFormatter(self.FIELDS + ["a;b"])
+        self.assertEqual(formatter.matcher, "regex")
+
+    def test_formatter_auto(self):
+        """Above the threshold "auto" picks the matcher, same output."""
+        self.assertEqual(RedactingFormatter(self.FIELDS).matcher, "set")
+        message = "msg=login, email=a@b.c;user:name=bob;username=bob;"
+        self.assertEqual(
+            RedactingFormatter(self.FIELDS).redact_text(message),
+            RedactingFormatter(self.FIELDS, matcher="regex").redact_text(
+                message))
+
+
+if __name__ == "__main__":
+    unittest.main()
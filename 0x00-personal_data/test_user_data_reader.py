@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+UserDataReader redacts PII by column.
+"""
+import os
+import tempfile
+import unittest
+
+from filtered_logger import redact_rows
+from user_data_reader import UserDataReader
+
+
+class TestUserDataReader(unittest.TestCase):
+    """Rows returned by the reader."""
+
+    def setUp(self):
+        """A CSV with separators and "=" inside values."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "users.csv")
+        with open(self.path, "w") as f:
+            f.write("name,email,phone,ssn,password,ip,user_agent\n"
+                    'Bob,bob@x.io,555;1,123,pw;secret,1.2.3.4,"a, b"\n'
+                    "Eve,eve@x.io,555,456,pw,5.6.7.8,note email=eve@x.io\n")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_separator_in_pii_value(self):
+        """No part of a PII value survives a ";" inside it."""
+        with UserDataReader(self.path) as reader:
+            self.assertEqual(
+                reader.row(0),
+                "name=***; email=***; phone=***; ssn=***; password=***; "
+                "ip=1.2.3.4; user_agent=a, b;")
+
+    def test_pairs_in_other_columns(self):
+        """key=value text inside a non-PII column is still redacted."""
+        with UserDataReader(self.path) as reader:
+            self.assertEqual(reader.find_by_email("EVE@x.io"), [
+                "name=***; email=***; phone=***; ssn=***; password=***; "
+                "ip=5.6.7.8; user_agent=note email=***;"])
+
+    def test_same_as_export(self):
+        """Rows read the same as the export path makes them."""
+        with UserDataReader(self.path) as reader:
+            self.assertEqual(
+                reader.rows(0, 2),
+                redact_rows(reader.columns, [reader.raw(0), reader.raw(1)]))
+
+    def test_corrupt_sidecar(self):
+        """A truncated or garbled sidecar is rebuilt."""
+        with UserDataReader(self.path) as reader:
+            expected = reader.rows(0, 2)
+        with open(self.path + ".idx", "rb") as f:
+            data = f.read()
+        for broken in (data[:8], data[:-3], data[:-8], data + b"\0",
+                       data[:6] + b"\xff" * (len(data) - 6)):
+            with open(self.path + ".idx", "wb") as f:
+                f.write(broken)
+            with UserDataReader(self.path) as reader:
+                self.assertEqual(reader.rows(0, 2), expected)
+            with open(self.path + ".idx", "rb") as f:
+                self.assertEqual(f.read(), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
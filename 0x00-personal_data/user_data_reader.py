@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Random access to large personal-data CSVs such as user_data.csv.
+
+A sidecar index (<csv>.idx) is built once: the byte offset of every data
+line in an `array`, plus optional 64-bit email hashes. The CSV is
+memory-mapped, so "row N", row ranges and email lookups cost a seek
+rather than a scan. Rows are redacted by column only when they are
+returned, by redact_rows, so they read exactly like exported rows.
+Records must not span lines. A sidecar that is stale, truncated or
+corrupt is rebuilt.
+"""
+import csv
+import hashlib
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, redact_rows
+
+
+MAGIC = b"UDIX1\n"
+# csv size, csv mtime_ns, row count, has email hashes
+HEADER = struct.Struct("<QQQB")
+
+
+def _email_hash(email: str) -> int:
+    """
+    Returns a stable 64-bit hash of a normalized email address.
+    """
+    digest = hashlib.blake2b(email.strip().lower().encode("utf-8"),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class UserDataReader:
+    """
+    Memory-mapped, offset-indexed reader for a personal-data CSV.
+    """
+
+    def __init__(self, csv_path: str, index_path: Optional[str] = None,
+                 email_index: bool = True,
+                 fields: Sequence[str] = PII_FIELDS,
+                 redaction: str = RedactingFormatter.REDACTION):
+        """
+        Open the CSV, loading the sidecar index or building it.
+
+        Args:
+            csv_path (str): The CSV file; its first line is the header.
+            index_path (Optional[str]): Sidecar path, default csv_path.idx.
+            email_index (bool): Whether to index the email column.
+            fields (Sequence[str]): Fields redacted in returned rows.
+            redaction (str): String to replace the field values with.
+        """
+        self.csv_path = csv_path
+        self.index_path = index_path or csv_path + ".idx"
+        self.fields = fields
+        self.redaction = redaction
+        self._file = open(csv_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0,
+                             access=mmap.ACCESS_READ) if size else b""
+        header_end = self._mm.find(b"\n")
+        header_end = len(self._mm) if header_end == -1 else header_end + 1
+        self.columns = next(csv.reader(
+            [self._mm[:header_end].decode("utf-8")]), [])
+        self._emails: Optional[Dict[int, object]] = None
+        if not self._load_index(email_index):
+            self._build_index(header_end, email_index)
+            self._save_index()
+
+    def _stat_key(self) -> tuple:
+        """
+        Returns the (size, mtime_ns) pair an index must match.
+        """
+        st = os.stat(self.csv_path)
+        return st.st_size, st.st_mtime_ns
+
+    def _build_index(self, start: int, email_index: bool) -> None:
+        """
+        Scans the file once, recording line offsets and email hashes.
+        """
+        mm = self._mm
+        offsets = array("Q")
+        hashes = array("Q")
+        email_col = self.columns.index("email") \
+            if email_index and "email" in self.columns else None
+        pos, size = start, len(mm)
+        while pos < size:
+            end = mm.find(b"\n", pos)
+            end = size if end == -1 else end + 1
+            line = mm[pos:end]
+            if line.strip():
+                offsets.append(pos)
+                if email_col is not None:
+                    row = next(csv.reader([line.decode("utf-8")]))
+                    email = row[email_col] if email_col < len(row) else ""
+                    hashes.append(_email_hash(email))
+            pos = end
+        offsets.append(size)
+        self._offsets = offsets
+        self._hashes = hashes if email_col is not None else None
+
+    def _save_index(self) -> None:
+        """
+        Writes the sidecar index atomically.
+        """
+        size, mtime_ns = self._stat_key()
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(size, mtime_ns, len(self),
+                                self._hashes is not None))
+            self._offsets.tofile(f)
+            if self._hashes is not None:
+                self._hashes.tofile(f)
+        os.replace(tmp_path, self.index_path)
+
+    def _load_index(self, email_index: bool) -> bool:
+        """
+        Loads the sidecar if it exists and matches the CSV.
+
+        A truncated or corrupt sidecar is treated as missing.
+        Returns:
+            bool: True if a usable index was loaded.
+        """
+        try:
+            f = open(self.index_path, "rb")
+        except FileNotFoundError:
+            return False
+        try:
+            with f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    return False
+                size, mtime_ns, count, has_hashes = HEADER.unpack(
+                    f.read(HEADER.size))
+                if (size, mtime_ns) != self._stat_key():
+                    return False
+                if email_index and not has_hashes:
+                    return False
+                offsets = array("Q")
+                offsets.fromfile(f, count + 1)
+                hashes = None
+                if has_hashes:
+                    hashes = array("Q")
+                    hashes.fromfile(f, count)
+                if f.read(1):
+                    return False
+        except (EOFError, MemoryError, OverflowError, ValueError,
+                struct.error):
+            return False
+        if offsets[-1] != size:
+            return False
+        self._offsets = offsets
+        self._hashes = hashes
+        return True
+
+    def __len__(self) -> int:
+        """
+        Returns the number of data rows.
+        """
+        return len(self._offsets) - 1
+
+    def raw(self, n: int) -> List[str]:
+        """
+        Returns the unredacted fields of row n.
+        Args:
+            n (int): Zero-based data row number; negative counts from the end.
+        Returns:
+            List[str]: The CSV fields.
+        """
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError("row index out of range")
+        line = self._mm[self._offsets[n]:self._offsets[n + 1]]
+        return next(csv.reader([line.decode("utf-8")]))
+
+    def row(self, n: int) -> str:
+        """
+        Returns row n as a redacted `key=value; ...;` message.
+        Args:
+            n (int): Zero-based data row number.
+        Returns:
+            str: The message with PII columns redacted.
+        """
+        return redact_rows(self.columns, [self.raw(n)], self.fields,
+                           self.redaction)[0]
+
+    def rows(self, start: int, stop: int) -> List[str]:
+        """
+        Returns redacted rows start..stop-1.
+        Args:
+            start (int): First row number.
+            stop (int): Row number after the last one returned.
+        Returns:
+            List[str]: The redacted messages.
+        """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return redact_rows(self.columns,
+                           [self.raw(n) for n in range(start, stop)],
+                           self.fields, self.redaction)
+
+    def find_by_email(self, email: str) -> List[str]:
+        """
+        Returns the redacted rows whose email matches.
+
+        The hash table is built from the sidecar on first use; candidates
+        are confirmed against the row itself to rule out collisions.
+        Args:
+            email (str): The address to look up, case-insensitive.
+        Returns:
+            List[str]: The redacted messages, in file order.
+        """
+        if self._hashes is None:
+            raise ValueError("reader was opened without an email index")
+        if self._emails is None:
+            emails: Dict[int, object] = {}
+            for n, h in enumerate(self._hashes):
+                found = emails.get(h)
+                if found is None:
+                    emails[h] = n
+                elif isinstance(found, list):
+                    found.append(n)
+                else:
+                    emails[h] = [found, n]
+            self._emails = emails
+
+        found = self._emails.get(_email_hash(email))
+        if found is None:
+            return []
+        candidates = found if isinstance(found, list) else [found]
+        email_col = self.columns.index("email")
+        wanted = email.strip().lower()
+        return [self.row(n) for n in candidates
+                if self.raw(n)[email_col].strip().lower() == wanted]
+
+    def close(self) -> None:
+        """
+        Unmaps and closes the CSV.
+        """
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "UserDataReader":
+        """Context manager entry."""
+        return self
+
+    def __exit__(self, *exc) -> None:
+        """Context manager exit."""
+        self.close()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Builds a local SQLite stand-in for the MySQL `users` table of main.sql.
+"""
+import csv
+import sqlite3
+import sys
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    name VARCHAR(256),
+    email VARCHAR(256),
+    phone VARCHAR(16),
+    ssn VARCHAR(16),
+    password VARCHAR(256),
+    ip VARCHAR(64),
+    last_login TIMESTAMP,
+    user_agent VARCHAR(512)
+);
+CREATE INDEX IF NOT EXISTS idx_users_last_login ON users(last_login);
+"""
+
+
+def build_users_db(db_path: str, csv_path: str = "user_data.csv",
+                   copies: int = 1) -> int:
+    """
+    Creates the users table at `db_path` and fills it from `csv_path`.
+    Args:
+        db_path (str): Path of the SQLite database file.
+        csv_path (str): CSV with the same columns as the users table.
+        copies (int): How many times the CSV rows are inserted.
+    Returns:
+        int: The number of rows inserted.
+    """
+    with open(csv_path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader)  # header
+        rows = [tuple(row) for row in reader if row]
+
+    db = sqlite3.connect(db_path)
+    try:
+        db.execute("DROP TABLE IF EXISTS users;")
+        db.executescript(SCHEMA)
+        for _ in range(copies):
+            db.executemany(
+                "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?);", rows)
+        db.commit()
+    finally:
+        db.close()
+    return len(rows) * copies
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "users.db"
+    copies = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    print("{} rows written to {}".format(build_users_db(path, copies=copies),
+                                         path))
@@ -81,12 +81,10 @@ class BasicAuth(Auth):
             return None
 
         # Search for the user by email
-        users = User.search({'email': user_email})
-        if not users:
+        user = User.query().filter(email=user_email).first()
+        if user is None:
             return None  # No user with given email found
 
-        user = users[0]  # Assume only one user with the given email
-
         # Validate password
         if not user.is_valid_password(user_pwd):
             return None
@@ -25,12 +25,11 @@ class SessionDBAuth(SessionExpAuth):
             return None
 
         # Retrieve UserSession from database by session_id
-        sessions = UserSession.search({'session_id': session_id})
-        if not sessions:
+        session = UserSession.query().filter(session_id=session_id).first()
+        if session is None:
             return None
 
         # Check expiration (using the superclass method)
-        session = sessions[0]
         if self.session_duration <= 0:
             return session.user_id
 
@@ -57,11 +56,10 @@ class SessionDBAuth(SessionExpAuth):
             return False
 
         # Find and delete session from the database
-        sessions = UserSession.search({'session_id': session_id})
-        if not sessions:
+        session = UserSession.query().filter(session_id=session_id).first()
+        if session is None:
             return False
 
         # Remove the session from the file-based database
-        session = sessions[0]
         session.remove()
         return True
@@ -20,8 +20,7 @@ def login():
         return jsonify({"error": "password missing"}), 400
 
     # Retrieve the user instance using the email
-    user_list = User.search({"email": email})
-    user = user_list[0] if user_list else None
+    user = User.query().filter(email=email).first()
     if not user:
         return jsonify({"error": "no user found for this email"}), 404
 
@@ -1,19 +1,87 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
+import json
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, jsonify, request, stream_with_context
 from models.user import User
 
 
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 100
+
+
+def project(user_json: dict, fields: list) -> dict:
+    """ Keep only the requested fields of a User JSON, if any
+    """
+    if fields is None:
+        return user_json
+    return {key: user_json[key] for key in fields if key in user_json}
+
+
+def user_json_bytes(user: User, fields: list) -> bytes:
+    """ User JSON encoded like User.to_json_bytes, projected on fields
+
+    Every list of users is encoded this way, streamed or paginated, so
+    keys come in the same order whichever path served the request.
+    """
+    if fields is None:
+        return user.to_json_bytes()
+    return json.dumps(project(user.to_json(), fields)).encode()
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: page size, at most MAX_PAGE_SIZE
+      - cursor: X-Next-Cursor header of the previous page
+      - fields: comma-separated fields to return
     Return:
-      - list of all User objects JSON represented
+      - list of User objects JSON represented, ordered by id
+      - with limit, one page and the X-Next-Cursor header if more follow
+      - without limit, all users in a streamed response
+      - 400 if limit is not a positive integer
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    fields = request.args.get('fields')
+    if fields is not None:
+        fields = [field.strip() for field in fields.split(',')]
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit')
+
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+        users, next_cursor = User.page(min(limit, MAX_PAGE_SIZE), cursor)
+        response = Response(
+            b"[" + b",".join(user_json_bytes(user, fields)
+                             for user in users) + b"]",
+            mimetype='application/json')
+        if next_cursor is not None:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+    def generate():
+        """ JSON array of all users, one batch of users per chunk
+        """
+        page_cursor = cursor
+        separator = b"["
+        while True:
+            users, page_cursor = User.page(STREAM_BATCH_SIZE, page_cursor)
+            if users:
+                yield separator + b",".join(user_json_bytes(user, fields)
+                                            for user in users)
+                separator = b","
+            if page_cursor is None:
+                break
+        yield b"[]" if separator == b"[" else b"]"
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+""" Multi-threaded stress test and throughput benchmark of models.base
+
+The stress test runs writers (create, update, remove), readers (get,
+search, scans, pages) and a thread calling save_to_file at the same
+time, then checks that DATA, the email index, the id order and the
+snapshot on disk agree.
+
+The benchmark measures operations per second over thread counts, with
+DATA as StripedObjects and as a plain dict. StripedObjects is one dict
+changed under a single store lock with copy-on-write snapshots for
+readers; only the writer locks handed out per id are striped, so saves
+of different users rarely wait on each other. With a plain dict every
+save takes the class lock instead.
+
+    ./bench_concurrency.py stress [threads] [seconds]   (default 8, 5)
+    ./bench_concurrency.py [users] [ops]                (default 10000,
+                                                         20000)
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from models.base import DATA, INDEXES, ORDERS
+from models.snapshot import JsonSnapshot
+from models.storage import WriteBehindStorage
+from models.store import StripedObjects
+import models.storage
+from models.user import User
+
+THREADS = (1, 2, 4, 8)
+
+
+def setup(users: int, striped: bool = True):
+    """ DATA with `users` users, saved through a write-behind engine
+    """
+    models.storage._storage = WriteBehindStorage(
+        JsonSnapshot(), interval=3600, max_pending=10 ** 9)
+    DATA['User'] = StripedObjects() if striped else {}
+    INDEXES.pop('User', None)
+    ORDERS.pop('User', None)
+    for i in range(users):
+        User(email="user{}@example.com".format(i)).save()
+
+
+def run(threads: int, work) -> list:
+    """ Run work(thread number) in `threads` threads; return the errors
+    """
+    errors = []
+
+    def target(n):
+        try:
+            work(n)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=target, args=(n,))
+               for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return errors
+
+
+def check():
+    """ Assert that DATA, the index, the id order and the disk agree
+    """
+    objs = DATA['User']
+    ids = set(objs)
+    assert len(ids) == len(objs) == User.count()
+    index = User._indexes()['email']
+    assert set(index.values) == ids, "index ids differ from DATA"
+    for obj_id in ids:
+        assert index.values[obj_id] == objs[obj_id].email, "stale index"
+    assert User._ordered_ids() == sorted(ids), "id order differs"
+    User.flush()
+    assert set(JsonSnapshot().load(User)) == ids, "snapshot differs"
+
+
+def stress(threads: int, seconds: float) -> int:
+    """ Run the stress test; return the exit status
+    """
+    setup(1000)
+    User._ordered_ids()
+    deadline = time.monotonic() + seconds
+    counts = [0] * (threads + 1)
+
+    def work(n):
+        rand = random.Random(n)
+        while time.monotonic() < deadline:
+            op = rand.random()
+            ids = list(DATA['User'])
+            user = User.get(rand.choice(ids)) if ids else None
+            if n == threads:
+                User.save_to_file()
+            elif op < 0.2:
+                User(email="t{}-{}@example.com".format(n, counts[n])).save()
+            elif op < 0.3 and user is not None:
+                user.email = "u{}-{}@example.com".format(n, counts[n])
+                user.save()
+            elif op < 0.4 and user is not None:
+                user.remove()
+            elif op < 0.6 and user is not None:
+                found = User.search({"email": user.email})
+                assert all(u.email == user.email for u in found)
+            elif op < 0.7:
+                User.query().where("email", "prefix", "t1-").count()
+            else:
+                page, cursor = User.page(50, user.id if user else None)
+                assert [u.id for u in page] == sorted(u.id for u in page)
+            counts[n] += 1
+
+    errors = run(threads + 1, work)
+    for error in errors:
+        print("error: {!r}".format(error))
+    check()
+    print("{} operations in {} threads, {} users left: ok".format(
+        sum(counts), threads + 1, User.count()))
+    return 1 if errors else 0
+
+
+def throughput(threads: int, ops: int, striped: bool, users: int,
+               writes: float) -> float:
+    """ Operations per second of `threads` threads sharing `ops`
+    operations, a fraction `writes` of them saves
+    """
+    setup(users, striped)
+    ids = list(DATA['User'])
+    per_thread = ops // threads
+
+    def work(n):
+        rand = random.Random(n)
+        for i in range(per_thread):
+            user = User.get(rand.choice(ids))
+            if rand.random() < writes:
+                user.save()
+            else:
+                User.search({"email": user.email})
+
+    start = time.perf_counter()
+    errors = run(threads, work)
+    seconds = time.perf_counter() - start
+    assert not errors, errors
+    return per_thread * threads / seconds
+
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp())
+    if sys.argv[1:2] == ["stress"]:
+        sys.exit(stress(int(sys.argv[2]) if len(sys.argv) > 2 else 8,
+                        float(sys.argv[3]) if len(sys.argv) > 3 else 5))
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    print("{:>7} {:>7} {:>12} {:>12}".format(
+        "threads", "writes", "striped/s", "dict/s"))
+    for writes in (0.0, 0.2, 1.0):
+        for threads in THREADS:
+            print("{:>7} {:>6.0%} {:>12.0f} {:>12.0f}".format(
+                threads, writes,
+                throughput(threads, ops, True, users, writes),
+                throughput(threads, ops, False, users, writes)))
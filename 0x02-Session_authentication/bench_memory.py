@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+""" Bytes per User object: __dict__ and datetimes vs slots and ints
+
+The "dict" layout reproduces the model before slots: every instance has
+a __dict__ and two datetime objects.
+
+    ./bench_memory.py [users]    (default 100000)
+"""
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from models.user import User
+
+
+class DictUser():
+    """ User as laid out before slots
+    """
+
+    def __init__(self, email: str, password: str):
+        """ Same attributes, in the same order, as User
+        """
+        self.id = str(uuid.uuid4())
+        self.created_at = datetime.utcnow()
+        self.updated_at = datetime.utcnow()
+        self.email = email
+        self._password = password
+        self.first_name = None
+        self.last_name = None
+
+
+def bytes_per_object(make, count: int) -> float:
+    """ Traced allocations per object built by make(i)
+    """
+    tracemalloc.start()
+    objs = [make(i) for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objs
+    return size / count
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    password = "a" * 64
+    layouts = (
+        ("dict", lambda i: DictUser("user{}@example.com".format(i),
+                                    password)),
+        ("slots", lambda i: User(email="user{}@example.com".format(i),
+                                 _password=password)),
+    )
+    print("{:>6} {:>12}".format("layout", "bytes/user"))
+    for name, make in layouts:
+        print("{:>6} {:>12.0f}".format(name, bytes_per_object(make, count)))
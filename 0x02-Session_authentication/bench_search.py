@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+""" Benchmark of User.search by email: full scan vs hash index
+
+    ./bench_search.py [max users]    (default 1000000)
+"""
+import sys
+import timeit
+
+from models.base import DATA
+from models.user import User
+
+
+def populate(count: int):
+    """ Fill DATA with `count` users without touching the storage
+    """
+    users = DATA.setdefault('User', {})
+    for i in range(len(users), count):
+        user = User(email="user{}@example.com".format(i))
+        users[user.id] = user
+    User._rebuild_indexes()
+
+
+def scan(email: str) -> list:
+    """ search() without an index
+    """
+    return [user for user in DATA['User'].values() if user.email == email]
+
+
+if __name__ == "__main__":
+    max_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    sizes = [n for n in (1000, 10000, 100000, 1000000) if n <= max_users]
+    print("{:>9} {:>12} {:>12}".format("users", "scan us", "index us"))
+    for size in sizes:
+        populate(size)
+        email = "user{}@example.com".format(size // 2)
+        assert scan(email) == User.search({'email': email})
+        number = max(1, 100000 // size)
+        t_scan = timeit.timeit(lambda: scan(email), number=number) / number
+        t_index = timeit.timeit(lambda: User.search({'email': email}),
+                                number=10000) / 10000
+        print("{:>9} {:>12.1f} {:>12.2f}".format(
+            size, t_scan * 1e6, t_index * 1e6))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+""" Benchmark of User.load_from_file: JSON vs binary snapshot
+
+Each snapshot is written to a temporary directory, then loaded the way
+load_from_file does (snapshot plus index rebuild):
+  - legacy: json.load and build every object upfront
+  - json / binary: lazy load; objects are built on first access
+  - "+ all": the lazy load followed by building every object
+
+    ./bench_snapshot.py [max users]    (default 1000000)
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from models.base import DATA
+from models.snapshot import BinarySnapshot, JsonSnapshot
+from models.user import User
+
+
+def timed(func) -> float:
+    """ Seconds taken by func()
+    """
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def load(snapshot):
+    """ What load_from_file does with a given snapshot format
+    """
+    DATA['User'] = snapshot.load(User)
+    User._rebuild_indexes()
+
+
+def load_legacy():
+    """ load_from_file before lazy snapshots
+    """
+    with open(".db_User.json", 'r') as f:
+        DATA['User'] = {obj_id: User(**obj_json)
+                        for obj_id, obj_json in json.load(f).items()}
+    User._rebuild_indexes()
+
+
+if __name__ == "__main__":
+    max_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    sizes = [n for n in (100000, 1000000) if n <= max_users]
+    os.chdir(tempfile.mkdtemp())
+    json_snapshot, binary_snapshot = JsonSnapshot(), BinarySnapshot()
+    print("{:>8} {:>9} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+        "users", "format", "MB", "legacy", "lazy", "+ get", "+ all"))
+    for size in sizes:
+        users = {}
+        for i in range(size):
+            user = User(email="user{}@example.com".format(i),
+                        first_name="First{}".format(i), last_name="Last")
+            user.password = "pwd"
+            users[user.id] = user
+        some_id = user.id
+        json_snapshot.write(User, users)
+        binary_snapshot.write(User, users)
+        del users
+        DATA.clear()
+
+        for name, snapshot in (("json", json_snapshot),
+                               ("binary", binary_snapshot)):
+            mb = os.path.getsize(snapshot.path("User")) / 1e6
+            legacy = timed(load_legacy) if name == "json" else None
+            DATA.clear()
+            lazy = timed(lambda: load(snapshot))
+            get = timed(lambda: User.get(some_id))
+            full = timed(lambda: User.all())
+            DATA.clear()
+            print("{:>8} {:>9} {:>8.1f} {:>8} {:>8.2f} {:>8.5f} "
+                  "{:>8.2f}".format(
+                      size, name, mb,
+                      "-" if legacy is None else "{:.2f}".format(legacy),
+                      lazy, get, lazy + full))
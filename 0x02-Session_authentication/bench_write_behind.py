@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+""" Benchmark of a burst of User saves: file vs write-behind engine
+
+The file engine rewrites the snapshot on every save, so it only runs a
+shorter burst; the write-behind engine coalesces the whole burst.
+
+    ./bench_write_behind.py [saves]    (default 10000)
+"""
+import os
+import sys
+import tempfile
+import time
+
+from models.base import DATA
+from models.snapshot import JsonSnapshot
+from models.storage import FileStorage, WriteBehindStorage
+import models.storage
+from models.user import User
+
+
+def burst(storage, saves: int) -> float:
+    """ Seconds taken by `saves` saves of new users, flush included
+    """
+    models.storage._storage = storage
+    DATA['User'] = {}
+    start = time.perf_counter()
+    for i in range(saves):
+        user = User(email="user{}@example.com".format(i))
+        user.password = "pwd"
+        user.save()
+    User.flush()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    saves = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    os.chdir(tempfile.mkdtemp())
+    print("{:>13} {:>7} {:>9} {:>10}".format(
+        "engine", "saves", "rewrites", "saves/s"))
+    baseline = min(saves, 1000)
+    seconds = burst(FileStorage(JsonSnapshot()), baseline)
+    print("{:>13} {:>7} {:>9} {:>10.0f}".format(
+        "file", baseline, baseline, baseline / seconds))
+    storage = WriteBehindStorage(JsonSnapshot(), interval=1.0,
+                                 max_pending=1000)
+    seconds = burst(storage, saves)
+    print("{:>13} {:>7} {:>9} {:>10.0f}".format(
+        "write_behind", saves, storage.writes, saves / seconds))
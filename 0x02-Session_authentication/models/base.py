@@ -1,39 +1,141 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import TypeVar, List, Iterable, Dict, Optional, Tuple
 import json
+import threading
 import uuid
 
+from models.index import HashIndex
+from models.query import Query
+from models.snapshot import EPOCH
+from models.storage import get_storage
+from models.store import StripedObjects
+
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEXES = {}
+ORDERS = {}
+FIELDS = {}
+LOCKS = {}
+
+MICROSECOND = timedelta(microseconds=1)
+_UNSET = object()
+
+
+def _micros(value) -> int:
+    """ Microseconds since the epoch of a timestamp: datetime, string or
+    epoch seconds
+    """
+    if isinstance(value, str):
+        value = datetime.strptime(value, TIMESTAMP_FORMAT)
+    if isinstance(value, datetime):
+        return (value - EPOCH) // MICROSECOND
+    return value * 1000000
 
 
 class Base():
     """ Base class
+
+    Instances have no __dict__: subclasses declare their attributes in
+    `__slots__`, and timestamps are stored as microseconds since the
+    epoch behind the `created_at` and `updated_at` properties.
+
+    The serialized forms of an instance are cached until one of its
+    attributes is set.
+
+    Subclasses declare the attributes `search` can look up by hash in
+    `__indexes__`; those also listed in `__unique__` must be unique
+    among saved objects. Setting an indexed attribute of a saved object
+    updates its index right away, so searches see the change before the
+    object is saved again, as a scan would.
+
+    Saved objects can be read and written from several threads: DATA
+    holds StripedObjects (see models.store), and the indexes and id
+    order of a class are changed under the lock of the class.
     """
 
+    __slots__ = ('id', '_created_at', '_updated_at', '_json_cache')
+    __indexes__: Tuple[str, ...] = ()
+    __unique__: Tuple[str, ...] = ()
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+            DATA[s_class] = StripedObjects()
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
-        else:
-            self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
-        else:
-            self.updated_at = datetime.utcnow()
+        created_at = kwargs.get('created_at')
+        updated_at = kwargs.get('updated_at')
+        if created_at is None or updated_at is None:
+            now = _micros(datetime.utcnow())
+        self._created_at = now if created_at is None else _micros(created_at)
+        self._updated_at = now if updated_at is None else _micros(updated_at)
+        if self._updated_at == self._created_at:
+            # Share one int object between equal timestamps
+            self._updated_at = self._created_at
+
+    @property
+    def created_at(self) -> datetime:
+        """ Creation time
+        """
+        if self._created_at is None:
+            return None
+        return EPOCH + timedelta(microseconds=self._created_at)
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        """ Set the creation time
+        """
+        self._created_at = None if value is None else _micros(value)
+
+    @property
+    def updated_at(self) -> datetime:
+        """ Last update time
+        """
+        if self._updated_at is None:
+            return None
+        return EPOCH + timedelta(microseconds=self._updated_at)
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        """ Set the last update time
+        """
+        self._updated_at = None if value is None else _micros(value)
+
+    def __setattr__(self, name: str, value):
+        """ Set an attribute and drop the cached serialized forms
+        """
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '_json_cache', None)
+        if name in self.__indexes__:
+            self._reindex(name, value)
+
+    def _reindex(self, attr: str, value):
+        """ Move a saved object to its new value in the index of attr
+
+        Indexes not built yet read current values when they are built,
+        and storages indexing objects themselves (no _get) only index
+        what they store.
+        """
+        cls = self.__class__
+        s_class = cls.__name__
+        indexes = INDEXES.get(s_class)
+        get = getattr(DATA.get(s_class), '_get', None)
+        if indexes is None or get is None:
+            return
+        with cls._lock():
+            try:
+                saved = get(self.id) is self
+            except (KeyError, AttributeError):
+                return
+            if saved:
+                indexes[attr].add(self.id, value)
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -47,9 +149,42 @@ class Base():
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
+        cache = self._cached_json()
+        result = cache.get(for_serialization)
+        if result is None:
+            result = cache[for_serialization] = self._build_json(
+                for_serialization)
+        return dict(result)
+
+    def to_json_bytes(self, for_serialization: bool = False) -> bytes:
+        """ to_json() encoded as JSON
+        """
+        cache = self._cached_json()
+        key = (for_serialization, bytes)
+        result = cache.get(key)
+        if result is None:
+            result = cache[key] = json.dumps(
+                self.to_json(for_serialization)).encode()
+        return result
+
+    def _cached_json(self) -> dict:
+        """ Cache of the serialized forms, created on first use
+        """
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            cache = {}
+            object.__setattr__(self, '_json_cache', cache)
+        return cache
+
+    def _build_json(self, for_serialization: bool) -> dict:
+        """ Serialize the attributes
+        """
         result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
+        items = [(key, getattr(self, key, _UNSET)) for key in self._fields()]
+        items.extend(getattr(self, '__dict__', {}).items())
+        for key, value in items:
+            if value is _UNSET or \
+                    (not for_serialization and key[0] == '_'):
                 continue
             if type(value) is datetime:
                 result[key] = value.strftime(TIMESTAMP_FORMAT)
@@ -57,55 +192,208 @@ class Base():
                 result[key] = value
         return result
 
+    @classmethod
+    def _fields(cls) -> Tuple[str, ...]:
+        """ Attributes held in slots, in declaration order
+        """
+        fields = FIELDS.get(cls)
+        if fields is None:
+            fields = ['id', 'created_at', 'updated_at']
+            for klass in reversed(cls.__mro__):
+                if klass is Base or not issubclass(klass, Base):
+                    continue
+                slots = klass.__dict__.get('__slots__', ())
+                if isinstance(slots, str):
+                    slots = (slots,)
+                fields.extend(slot for slot in slots
+                              if slot not in ('__dict__', '__weakref__'))
+            fields = FIELDS[cls] = tuple(fields)
+        return fields
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
+        objs = get_storage().load(cls)
+        with cls._lock():
+            DATA[s_class] = objs
+            ORDERS.pop(s_class, None)
+            cls._rebuild_indexes()
+
+    @staticmethod
+    def flush():
+        """ Write the mutations the storage engine still holds
+        """
+        get_storage().flush()
+
+    @classmethod
+    def _indexes(cls) -> Dict[str, HashIndex]:
+        """ Secondary indexes of the class, built on first use
+        """
+        indexes = INDEXES.get(cls.__name__)
+        if indexes is None:
+            with cls._lock():
+                indexes = INDEXES.get(cls.__name__)
+                if indexes is None:
+                    indexes = cls._rebuild_indexes()
+        return indexes
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def _rebuild_indexes(cls) -> Dict[str, HashIndex]:
+        """ Index every object of the class
+
+        Lazily loaded objects are indexed from their records, without
+        being built. Storages that index objects themselves provide the
+        indexes instead.
+        """
+        s_class = cls.__name__
+        with cls._lock():
+            objs = DATA.get(s_class, {})
+            if hasattr(objs, 'indexes'):
+                indexes = INDEXES[s_class] = objs.indexes()
+                return indexes
+            indexes = {attr: HashIndex(attr, attr in cls.__unique__)
+                       for attr in cls.__indexes__}
+            column = getattr(objs, 'column', None)
+            for attr, index in indexes.items():
+                index.build(column(attr) if column else
+                            ((obj_id, getattr(obj, attr))
+                             for obj_id, obj in objs.items()))
+            INDEXES[s_class] = indexes
+            return indexes
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
-
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+        cls._sync()
+        get_storage().save_all(cls, DATA[s_class])
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        cls = self.__class__
+        cls._sync()
+        self._put(touch=True)
+        changes = get_storage().saved(cls, self, DATA[cls.__name__])
+        if changes is not None:
+            cls._apply(changes, skip=self.id)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        cls = self.__class__
+        cls._sync()
+        if cls._drop(self.id):
+            changes = get_storage().removed(cls, self, DATA[cls.__name__])
+            if changes is not None:
+                cls._apply(changes, skip=self.id)
+
+    @classmethod
+    def _lock(cls) -> threading.RLock:
+        """ Lock of the indexes and the id order of the class
+        """
+        lock = LOCKS.get(cls.__name__)
+        if lock is None:
+            lock = LOCKS.setdefault(cls.__name__, threading.RLock())
+        return lock
+
+    @classmethod
+    def _id_lock(cls, objs, obj_id: str) -> threading.Lock:
+        """ Lock serializing the writers of one object, taken before the
+        lock of the class
+        """
+        lock = getattr(objs, 'lock', None)
+        return cls._lock() if lock is None else lock(obj_id)
+
+    def _put(self, touch: bool = False):
+        """ Store the object in DATA, the id order and the indexes
+
+        With `touch`, unique indexes are checked and updated_at is set
+        first. The object enters the indexes before DATA and the id order
+        after, so readers holding an id from either can find it.
+        """
+        cls = self.__class__
+        s_class = cls.__name__
+        objs = DATA[s_class]
+        with cls._id_lock(objs, self.id):
+            with cls._lock():
+                indexes = cls._indexes()
+                if touch:
+                    for attr, index in indexes.items():
+                        if index.unique:
+                            index.check_unique(self.id, getattr(self, attr))
+                    self.updated_at = datetime.utcnow()
+                for attr, index in indexes.items():
+                    index.add(self.id, getattr(self, attr))
+            new = self.id not in objs
+            objs[self.id] = self
+            if new:
+                with cls._lock():
+                    ids = ORDERS.get(s_class)
+                    if ids is not None:
+                        i = bisect_left(ids, self.id)
+                        if i == len(ids) or ids[i] != self.id:
+                            ids.insert(i, self.id)
+
+    @classmethod
+    def _drop(cls, obj_id: str) -> bool:
+        """ Remove an object from DATA, the id order and the indexes;
+        False if it was not saved
+        """
+        s_class = cls.__name__
+        objs = DATA[s_class]
+        with cls._id_lock(objs, obj_id):
+            try:
+                del objs[obj_id]
+            except KeyError:
+                return False
+            with cls._lock():
+                ids = ORDERS.get(s_class)
+                if ids is not None:
+                    i = bisect_left(ids, obj_id)
+                    if i < len(ids) and ids[i] == obj_id:
+                        del ids[i]
+                for index in cls._indexes().values():
+                    index.discard(obj_id)
+        return True
+
+    @classmethod
+    def _sync(cls):
+        """ Apply the changes other processes made to the storage
+        """
+        changes = get_storage().refresh(cls)
+        if changes is not None:
+            cls._apply(changes)
+
+    @classmethod
+    def _apply(cls, changes: tuple, skip: Optional[str] = None):
+        """ Apply changes read by the storage engine: ("reload", objects)
+        or ("apply", [(op, id, object), ...]), ignoring the id `skip`
+        """
+        s_class = cls.__name__
+        kind, payload = changes
+        if kind == "reload":
+            with cls._lock():
+                DATA[s_class] = payload
+                ORDERS.pop(s_class, None)
+                cls._rebuild_indexes()
+            return
+        for op, obj_id, obj in payload:
+            if obj_id == skip:
+                continue
+            cls._drop(obj_id)
+            if op == "save":
+                obj._put()
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
         s_class = cls.__name__
+        cls._sync()
         return len(DATA[s_class].keys())
 
     @classmethod
@@ -119,19 +407,68 @@ class Base():
         """ Return one object by ID
         """
         s_class = cls.__name__
+        cls._sync()
         return DATA[s_class].get(id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+
+        If an attribute is indexed, only the objects indexed under its
+        value are checked instead of every object of the class.
+        """
+        return cls.query().filter(**attributes).all()
+
+    @classmethod
+    def query(cls) -> Query:
+        """ Lazy query over all objects (see models.query)
+        """
+        return Query(cls)
+
+    @classmethod
+    def _objects(cls) -> Dict[str, TypeVar('Base')]:
+        """ Saved objects of the class by id
+        """
+        cls._sync()
+        return DATA.get(cls.__name__, {})
+
+    @classmethod
+    def _ordered_ids(cls) -> List[str]:
+        """ Ids of the class in ascending order, kept sorted on save and
+        remove once built, or read from storages that keep them ordered
         """
         s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        ids = ORDERS.get(s_class)
+        if ids is None:
+            objs = cls._objects()
+            if hasattr(objs, 'ordered_ids'):
+                return objs.ordered_ids()
+            with cls._lock():
+                ids = ORDERS.get(s_class)
+                if ids is None:
+                    ids = ORDERS[s_class] = sorted(objs)
+        return ids
+
+    @classmethod
+    def page(cls, limit: int,
+             cursor: Optional[str] = None
+             ) -> Tuple[List[TypeVar('Base')], Optional[str]]:
+        """ Up to `limit` objects ordered by id, after the id `cursor`
+
+        Return the objects and the cursor of the next page, None on the
+        last page. The order is stable across saves and removes.
+        """
+        objs = cls._objects()
+        if hasattr(objs, 'ids_after'):
+            page_ids = objs.ids_after(cursor, limit + 1)
+            more = len(page_ids) > limit
+            page_ids = page_ids[:limit]
+        else:
+            ids = cls._ordered_ids()
+            start = 0 if cursor is None else bisect_right(ids, cursor)
+            page_ids = ids[start:start + limit]
+            more = start + limit < len(ids)
+        next_cursor = page_ids[-1] if page_ids and more else None
+        # Ids removed since they were read are skipped
+        page = [objs.get(obj_id) for obj_id in page_ids]
+        return [obj for obj in page if obj is not None], next_cursor
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+""" Secondary indexes for models.base
+"""
+from typing import Any, Dict, Hashable, Iterable, Tuple
+
+
+class HashIndex():
+    """ Hash index of one attribute: value -> ids of the saved objects
+
+    Ids are kept in insertion-ordered dicts so lookups return objects in
+    the order they were indexed. Unhashable values cannot be indexed:
+    their ids are returned by every lookup and filtered by the caller.
+    """
+
+    def __init__(self, attr: str, unique: bool = False):
+        """ Initialize an empty index
+        """
+        self.attr = attr
+        self.unique = unique
+        self.entries: Dict[Hashable, Dict[str, None]] = {}
+        self.values: Dict[str, Any] = {}
+        self.unhashable: Dict[str, None] = {}
+
+    def add(self, obj_id: str, value: Any):
+        """ Index an object, replacing its previous value
+        """
+        self.discard(obj_id)
+        try:
+            ids = self.entries.setdefault(value, {})
+        except TypeError:
+            self.unhashable[obj_id] = None
+            return
+        ids[obj_id] = None
+        self.values[obj_id] = value
+
+    def build(self, items: Iterable[Tuple[str, Any]]):
+        """ Index (id, value) pairs of objects not indexed yet
+        """
+        entries = self.entries
+        values = self.values
+        for obj_id, value in items:
+            try:
+                ids = entries.get(value)
+            except TypeError:
+                self.unhashable[obj_id] = None
+                continue
+            if ids is None:
+                entries[value] = {obj_id: None}
+            else:
+                ids[obj_id] = None
+            values[obj_id] = value
+
+    def discard(self, obj_id: str):
+        """ Remove an object from the index
+        """
+        if obj_id in self.values:
+            value = self.values.pop(obj_id)
+            ids = self.entries[value]
+            del ids[obj_id]
+            if not ids:
+                del self.entries[value]
+        else:
+            self.unhashable.pop(obj_id, None)
+
+    def check_unique(self, obj_id: str, value: Any):
+        """ Raise ValueError if another object is indexed under value
+        """
+        try:
+            ids = self.entries.get(value, {})
+        except TypeError:
+            return
+        if any(other != obj_id for other in ids):
+            raise ValueError("{} must be unique: {!r} already exists".format(
+                self.attr, value))
+
+    def lookup(self, value: Any) -> Iterable[str]:
+        """ Ids of the objects that may have attr == value
+        """
+        try:
+            ids = self.entries.get(value, {})
+        except TypeError:
+            ids = {}
+        if not self.unhashable:
+            return ids
+        return list(ids) + list(self.unhashable)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+""" Query API for models.base
+
+    User.query().filter(email="bob@hbtn.io").first()
+    User.query().where("email", "suffix", "@hbtn.io").exists()
+    User.query().where("created_at", "between", (start, end)) \
+        .order_by("created_at", reverse=True).limit(10).all()
+
+Queries are lazy: nothing runs until the query is iterated or one of
+all(), first(), exists() or count() is called, and iteration stops as
+soon as `limit` objects matched. The planner reads candidates from a
+hash index when an equality condition is on an indexed attribute, walks
+the id order when the query is ordered by id, and scans otherwise.
+Without order_by, objects come in the order they were first saved or
+loaded, in every process; through an index, in the order they took the
+looked-up value.
+"""
+import heapq
+from itertools import islice
+from typing import Any, Callable, Iterator, List, Optional, Tuple, TypeVar
+
+
+def _between(value: Any, bounds: Tuple[Any, Any]) -> bool:
+    """ low <= value <= high
+    """
+    return bounds[0] <= value <= bounds[1]
+
+
+def _found(objs, ids: List[str]) -> Iterator[TypeVar('Base')]:
+    """ Objects of the ids that are still saved
+    """
+    for obj in map(objs.get, ids):
+        if obj is not None:
+            yield obj
+
+
+OPERATORS = {
+    "eq": lambda value, arg: value == arg,
+    "ne": lambda value, arg: value != arg,
+    "lt": lambda value, arg: value < arg,
+    "le": lambda value, arg: value <= arg,
+    "gt": lambda value, arg: value > arg,
+    "ge": lambda value, arg: value >= arg,
+    "between": _between,
+    "in": lambda value, arg: value in arg,
+    "prefix": lambda value, arg: value.startswith(arg),
+    "suffix": lambda value, arg: value.endswith(arg),
+}
+
+
+class Query():
+    """ Lazy query over the saved objects of a model class
+    """
+
+    def __init__(self, cls):
+        """ Query every object of cls
+        """
+        self._cls = cls
+        self._conditions: List[Tuple[str, str, Any]] = []
+        self._order: Optional[Tuple[str, bool]] = None
+        self._limit: Optional[int] = None
+
+    def _copy(self) -> 'Query':
+        """ Copy of the query, so queries can be refined independently
+        """
+        query = Query(self._cls)
+        query._conditions = list(self._conditions)
+        query._order = self._order
+        query._limit = self._limit
+        return query
+
+    def filter(self, **attributes: Any) -> 'Query':
+        """ Objects whose attributes equal the given values
+        """
+        query = self._copy()
+        query._conditions.extend(
+            (attr, "eq", value) for attr, value in attributes.items())
+        return query
+
+    def where(self, attr: str, op: str, value: Any) -> 'Query':
+        """ Objects whose attribute matches `op` (see OPERATORS)
+        """
+        if op not in OPERATORS:
+            raise ValueError("Unknown operator: {}".format(op))
+        query = self._copy()
+        query._conditions.append((attr, op, value))
+        return query
+
+    def order_by(self, attr: str, reverse: bool = False) -> 'Query':
+        """ Order results by an attribute
+        """
+        query = self._copy()
+        query._order = (attr, reverse)
+        return query
+
+    def limit(self, count: int) -> 'Query':
+        """ Stop after `count` results
+        """
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def plan(self) -> str:
+        """ How candidates are read: "index:<attr>", "order:id" or "scan"
+        """
+        return self._candidates()[0]
+
+    def _candidates(self) -> Tuple[str, Callable[[], Iterator]]:
+        """ Plan name and a function yielding the candidate objects
+        """
+        cls = self._cls
+        objs = cls._objects()
+        indexes = cls._indexes()
+        best = None
+        for attr, op, value in self._conditions:
+            if op == "eq" and attr in indexes:
+                ids = indexes[attr].lookup(value)
+                if best is None or len(ids) < len(best[1]):
+                    best = (attr, ids)
+        # Ids removed since they were read are skipped
+        if best is not None:
+            return "index:" + best[0], lambda: _found(objs, list(best[1]))
+        if self._order is not None and self._order[0] == "id":
+            ids = cls._ordered_ids()
+            ordered = reversed(ids) if self._order[1] else iter(ids)
+            return "order:id", lambda: _found(objs, list(ordered))
+        return "scan", lambda: _found(objs, list(objs))
+
+    def _matches(self, obj: TypeVar('Base')) -> bool:
+        """ Whether an object meets every condition
+        """
+        for attr, op, arg in self._conditions:
+            try:
+                if not OPERATORS[op](getattr(obj, attr), arg):
+                    return False
+            except (AttributeError, TypeError):
+                return False
+        return True
+
+    def __iter__(self) -> Iterator[TypeVar('Base')]:
+        """ Matching objects, produced lazily
+        """
+        plan, candidates = self._candidates()
+        matches = filter(self._matches, candidates())
+        if self._order is not None and plan != "order:id":
+            attr, reverse = self._order
+
+            def key(obj):
+                """ Sort key that puts None values first
+                """
+                value = getattr(obj, attr, None)
+                return (value is not None, value)
+
+            if self._limit is None:
+                matches = iter(sorted(matches, key=key, reverse=reverse))
+            else:
+                pick = heapq.nlargest if reverse else heapq.nsmallest
+                matches = iter(pick(self._limit, matches, key=key))
+        if self._limit is not None:
+            matches = islice(matches, self._limit)
+        return matches
+
+    def all(self) -> List[TypeVar('Base')]:
+        """ List of the matching objects
+        """
+        return list(self)
+
+    def first(self) -> Optional[TypeVar('Base')]:
+        """ First matching object, or None
+        """
+        return next(iter(self.limit(1)), None)
+
+    def exists(self) -> bool:
+        """ Whether any object matches
+        """
+        return self.first() is not None
+
+    def count(self) -> int:
+        """ Number of matching objects
+        """
+        if not self._conditions and self._limit is None:
+            return len(self._cls._objects())
+        return sum(1 for _ in self)
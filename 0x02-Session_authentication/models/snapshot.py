@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+""" Snapshot formats for models.storage
+
+Two formats hold the full state of a class:
+  - "json": .db_<Class>.json, {id: to_json(True)}
+  - "binary": .db_<Class>.bin, marshal records with timestamps as epoch
+    seconds. Record offsets, ids and the values of indexed attributes
+    sit in a footer, so a load is one mmap plus one footer decode.
+
+Both load into a LazyObjects mapping: an object is only built from its
+record the first time it is accessed. LazyObjects is a StripedObjects
+(see models.store), so it can be read and written from several threads.
+
+    python3 -m models.snapshot {json,binary} User    # export a class
+"""
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from os import path
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+from models.store import StripedObjects
+
+
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+TIMESTAMPS = ('created_at', 'updated_at')
+
+
+def to_epoch(value: datetime) -> int:
+    """ Naive UTC datetime to epoch seconds
+    """
+    return (value - EPOCH) // SECOND
+
+
+class LazyObjects(StripedObjects):
+    """ Objects of a class, built from their snapshot record on first
+    access
+
+    Unaccessed records can be written back to a snapshot of the same
+    format without being decoded.
+    """
+
+    def __init__(self, cls, source, records: Dict[str, Any]):
+        """ Wrap {id: record} read from `source`
+        """
+        super().__init__(records)
+        self._cls = cls
+        self._source = source
+
+    def _is_record(self, item: Any) -> bool:
+        """ Whether an item is still an undecoded record
+        """
+        return type(item) is self._source.record_type
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        """ Object by id, built on first access
+        """
+        item = self._get(obj_id)
+        if self._is_record(item):
+            item = self._replace(
+                obj_id, item, self._cls(**self._source.decode(item)))
+        return item
+
+    def peek(self, obj_id: str, attr: str) -> Any:
+        """ Attribute of an object, read from its record when possible
+        """
+        item = self._get(obj_id)
+        if self._is_record(item):
+            try:
+                return self._source.getter(attr)(item)
+            except KeyError:
+                pass
+        return getattr(self[obj_id], attr)
+
+    def column(self, attr: str) -> Iterator[Tuple[str, Any]]:
+        """ (id, attribute) of every object, read from records when
+        possible
+        """
+        record_type = self._source.record_type
+        try:
+            get = self._source.getter(attr)
+        except KeyError:
+            get = None
+        for obj_id, item in self._items():
+            if type(item) is record_type:
+                if get is not None:
+                    try:
+                        yield obj_id, get(item)
+                        continue
+                    except KeyError:
+                        pass
+                item = self._replace(
+                    obj_id, item, self._cls(**self._source.decode(item)))
+            yield obj_id, getattr(item, attr)
+
+    def raw(self, obj_id: str, format_name: str) -> Optional[Any]:
+        """ Undecoded record of an object if it is still in the given
+        format, else None
+        """
+        item = self._get(obj_id)
+        if self._is_record(item) and self._source.name == format_name:
+            return self._source.raw(item)
+        return None
+
+
+def _raw(objs, obj_id: str, format_name: str) -> Optional[Any]:
+    """ Reusable record of an object, if any
+    """
+    if isinstance(objs, LazyObjects):
+        return objs.raw(obj_id, format_name)
+    return None
+
+
+def _write_atomic(file_path: str, data: bytes, fsync: bool):
+    """ Replace a file with data
+    """
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+class JsonSnapshot():
+    """ {id: to_json(True)} in .db_<Class>.json
+    """
+
+    name = "json"
+    record_type = dict
+
+    def path(self, s_class: str) -> str:
+        """ Snapshot path of a class
+        """
+        return ".db_{}.json".format(s_class)
+
+    def load(self, cls) -> LazyObjects:
+        """ Load the snapshot of a class
+        """
+        file_path = self.path(cls.__name__)
+        records = {}
+        if path.exists(file_path):
+            with open(file_path, 'r') as f:
+                records = json.load(f)
+        return LazyObjects(cls, self, records)
+
+    def decode(self, record: dict) -> dict:
+        """ Constructor arguments of a record
+        """
+        return record
+
+    def raw(self, record: dict) -> dict:
+        """ Record as written to the file
+        """
+        return record
+
+    def getter(self, attr: str) -> Callable[[dict], Any]:
+        """ Reader of an attribute stored in records
+        """
+        return itemgetter(attr)
+
+    def write(self, cls, objs, fsync: bool = False):
+        """ Write the snapshot of a class
+
+        The file is assembled from the cached JSON bytes of each object,
+        with the same layout as json.dumps({id: to_json(True)}).
+        """
+        chunks = []
+        for obj_id in list(objs):
+            try:
+                record = _raw(objs, obj_id, self.name)
+                if record is None:
+                    fragment = objs[obj_id].to_json_bytes(True)
+                else:
+                    fragment = json.dumps(record).encode()
+            except KeyError:
+                continue  # removed while writing
+            chunks.append(json.dumps(obj_id).encode() + b": " + fragment)
+        _write_atomic(self.path(cls.__name__),
+                      b"{" + b", ".join(chunks) + b"}", fsync)
+
+
+MAGIC = b"MODELS1\n"
+TRAILER = struct.Struct("<Q8s")
+
+
+class _BinaryFile():
+    """ Memory-mapped binary snapshot; records are positions in it
+    """
+
+    name = "binary"
+    record_type = int
+
+    def __init__(self, file_path: str):
+        """ Map the file and decode its footer
+        """
+        with open(file_path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_offset, magic = TRAILER.unpack_from(
+            self.buf, len(self.buf) - TRAILER.size)
+        if self.buf[:len(MAGIC)] != MAGIC or magic != MAGIC:
+            raise ValueError("{} is not a binary snapshot".format(
+                file_path))
+        ids, offsets, self.index_values = marshal.loads(
+            self.buf[footer_offset:len(self.buf) - TRAILER.size])
+        self.ids = ids
+        self.offsets = array('Q')
+        self.offsets.frombytes(offsets)
+
+    def raw(self, position: int) -> bytes:
+        """ Marshalled record at a position
+        """
+        return self.buf[self.offsets[position]:self.offsets[position + 1]]
+
+    def decode(self, position: int) -> dict:
+        """ Constructor arguments of the record at a position
+        """
+        return marshal.loads(self.raw(position))
+
+    def getter(self, attr: str) -> Callable[[int], Any]:
+        """ Reader of an indexed attribute, by record position
+
+        Raises KeyError if the attribute is not in the footer.
+        """
+        return self.index_values[attr].__getitem__
+
+
+class BinarySnapshot():
+    """ Marshal records plus a footer in .db_<Class>.bin
+
+    Layout: MAGIC, one marshalled dict per object, then a marshalled
+    footer (ids, record offsets, {indexed attribute: values}), then the
+    footer offset and MAGIC again.
+    """
+
+    name = "binary"
+
+    def path(self, s_class: str) -> str:
+        """ Snapshot path of a class
+        """
+        return ".db_{}.bin".format(s_class)
+
+    def load(self, cls) -> LazyObjects:
+        """ Load the snapshot of a class
+
+        Falls back to the JSON snapshot if there is no binary one yet.
+        """
+        file_path = self.path(cls.__name__)
+        if not path.exists(file_path):
+            return JsonSnapshot().load(cls)
+        source = _BinaryFile(file_path)
+        return LazyObjects(cls, source,
+                           dict(zip(source.ids, range(len(source.ids)))))
+
+    @staticmethod
+    def encode(obj: TypeVar('Base')) -> bytes:
+        """ Marshalled record of an object
+        """
+        record = obj.to_json(True)
+        for key in TIMESTAMPS:
+            value = getattr(obj, key, None)
+            if isinstance(value, datetime):
+                record[key] = to_epoch(value)
+        return marshal.dumps(record)
+
+    def write(self, cls, objs, fsync: bool = False):
+        """ Write the snapshot of a class
+        """
+        attrs = tuple(cls.__indexes__)
+        ids = []
+        offsets = array('Q', [len(MAGIC)])
+        index_values = {attr: [] for attr in attrs}
+        chunks = [MAGIC]
+        for obj_id in list(objs):
+            try:
+                record = _raw(objs, obj_id, self.name)
+                if record is None:
+                    obj = objs[obj_id]
+                    record = self.encode(obj)
+                    values = [getattr(obj, attr) for attr in attrs]
+                else:
+                    values = [objs.peek(obj_id, attr) for attr in attrs]
+            except KeyError:
+                continue  # removed while writing
+            for attr, value in zip(attrs, values):
+                index_values[attr].append(value)
+            ids.append(obj_id)
+            chunks.append(record)
+            offsets.append(offsets[-1] + len(record))
+        footer_offset = offsets[-1]
+        chunks.append(marshal.dumps((ids, offsets.tobytes(), index_values)))
+        chunks.append(TRAILER.pack(footer_offset, MAGIC))
+        _write_atomic(self.path(cls.__name__), b"".join(chunks), fsync)
+
+
+FORMATS = {"json": JsonSnapshot, "binary": BinarySnapshot}
+
+
+def convert(cls, format_name: str):
+    """ Rewrite the state of a class as a snapshot in another format
+
+    The state is read through the configured engine (MODELS_STORAGE,
+    MODELS_SNAPSHOT_FORMAT), journal included.
+    """
+    from models.storage import get_storage
+    FORMATS[format_name]().write(cls, get_storage().load(cls))
+
+
+if __name__ == "__main__":
+    import importlib
+    import re
+    if len(sys.argv) != 3 or sys.argv[1] not in FORMATS:
+        sys.exit("usage: python3 -m models.snapshot {json,binary} <Class>")
+    module = importlib.import_module("models." + re.sub(
+        r'(?<!^)(?=[A-Z])', '_', sys.argv[2]).lower())
+    convert(getattr(module, sys.argv[2]), sys.argv[1])
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+""" SQLite storage engine for models.base
+
+MODELS_STORAGE=sqlite keeps every class in one table of an SQLite
+database (MODELS_SQLITE_PATH, .db.sqlite3 by default) in WAL mode:
+
+    CREATE TABLE "User" (id TEXT PRIMARY KEY, data TEXT NOT NULL,
+                         "email")   -- one column per __indexes__ entry
+
+`data` holds to_json(True). Indexed attributes get their own indexed
+column, so get, search, count and the id order are answered by SQL and
+only the objects in use are kept in memory, in an LRU cache of
+MODELS_SQLITE_CACHE_SIZE objects per class. A class whose table does
+not exist yet is imported from its snapshot (MODELS_SNAPSHOT_FORMAT).
+"""
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, TypeVar
+
+from models.storage import FileStorage
+
+
+BATCH_SIZE = 1000
+SCALARS = (type(None), int, float, str, bytes)
+
+
+def _quote(name: str) -> str:
+    """ SQL identifier
+    """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _column_value(value: Any) -> Any:
+    """ Value stored in an indexed column; NULL for values SQLite cannot
+    hold, which are then matched by reading the object
+    """
+    return value if type(value) in SCALARS else None
+
+
+class SqliteIndex():
+    """ Indexed column of a table, with the interface of HashIndex
+
+    Rows are written by SqliteObjects, so add, build and discard have
+    nothing to do.
+    """
+
+    def __init__(self, objs: 'SqliteObjects', attr: str,
+                 unique: bool = False):
+        """ Index `attr` of the table behind objs
+        """
+        self._objs = objs
+        self.attr = attr
+        self.unique = unique
+
+    def add(self, obj_id: str, value: Any):
+        """ Nothing to do: the column is written with the row
+        """
+
+    def build(self, items):
+        """ Nothing to do: the column is written with the row
+        """
+
+    def discard(self, obj_id: str):
+        """ Nothing to do: the column is deleted with the row
+        """
+
+    def check_unique(self, obj_id: str, value: Any):
+        """ Raise ValueError if another object has attr == value
+        """
+        if type(value) not in SCALARS:
+            return
+        if self._objs.select_ids(self.attr, value, exclude=obj_id, limit=1):
+            raise ValueError("{} must be unique: {!r} already exists".format(
+                self.attr, value))
+
+    def lookup(self, value: Any) -> List[str]:
+        """ Ids of the objects that may have attr == value
+        """
+        return self._objs.select_ids(self.attr, _column_value(value))
+
+
+class _IdOrder():
+    """ Ids of a table in ascending order, read in batches
+    """
+
+    def __init__(self, objs: 'SqliteObjects'):
+        """ Order of the ids of objs
+        """
+        self._objs = objs
+
+    def __iter__(self) -> Iterator[str]:
+        """ Ascending ids
+        """
+        return self._objs.walk_ids(reverse=False)
+
+    def __reversed__(self) -> Iterator[str]:
+        """ Descending ids
+        """
+        return self._objs.walk_ids(reverse=True)
+
+
+class SqliteObjects(MutableMapping):
+    """ Objects of a class stored in a table, with an LRU cache of the
+    objects built from it
+
+    Setting an item upserts its row and deleting one deletes it; each
+    statement commits on its own.
+    """
+
+    def __init__(self, cls, conn: sqlite3.Connection, lock: threading.RLock,
+                 cache_size: int):
+        """ Wrap the table of cls, creating it if needed
+        """
+        self._cls = cls
+        self._conn = conn
+        self._lock = lock
+        self._table = _quote(cls.__name__)
+        self._attrs = tuple(cls.__indexes__)
+        self._cache: Dict[str, TypeVar('Base')] = OrderedDict()
+        self.cache_size = cache_size
+        columns = ", ".join(_quote(attr) for attr in self._attrs)
+        self._upsert = (
+            "INSERT INTO {0} (id, data{1}) VALUES (?, ?{2}) "
+            "ON CONFLICT(id) DO UPDATE SET data = excluded.data{3}".format(
+                self._table, ", " + columns if columns else "",
+                ", ?" * len(self._attrs),
+                "".join(", {0} = excluded.{0}".format(_quote(attr))
+                        for attr in self._attrs)))
+
+    def create(self) -> bool:
+        """ Create the table and its indexes; True if it did not exist
+        """
+        with self._lock:
+            existing = {row[1] for row in self._conn.execute(
+                "PRAGMA table_info({})".format(self._table))}
+            if not existing:
+                self._conn.execute(
+                    "CREATE TABLE {} (id TEXT PRIMARY KEY, "
+                    "data TEXT NOT NULL)".format(self._table))
+            for attr in self._attrs:
+                if attr not in existing:
+                    self._conn.execute("ALTER TABLE {} ADD COLUMN {}".format(
+                        self._table, _quote(attr)))
+                    self._conn.execute(
+                        "UPDATE {} SET {} = json_extract(data, ?)".format(
+                            self._table, _quote(attr)),
+                        ("$." + attr,))
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                        _quote("{}_{}".format(self._cls.__name__, attr)),
+                        self._table, _quote(attr)))
+            return not existing
+
+    def _row(self, obj: TypeVar('Base')) -> tuple:
+        """ Parameters of the upsert of an object
+        """
+        return (obj.id, obj.to_json_bytes(True).decode()) + tuple(
+            _column_value(getattr(obj, attr, None)) for attr in self._attrs)
+
+    def _remember(self, obj_id: str, obj: TypeVar('Base')):
+        """ Cache an object, evicting the least recently used
+        """
+        self._cache[obj_id] = obj
+        self._cache.move_to_end(obj_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        """ Object by id, from the cache or its row
+        """
+        with self._lock:
+            obj = self._cache.get(obj_id)
+            if obj is not None:
+                self._cache.move_to_end(obj_id)
+                return obj
+            row = self._conn.execute(
+                "SELECT data FROM {} WHERE id = ?".format(self._table),
+                (obj_id,)).fetchone()
+            if row is None:
+                raise KeyError(obj_id)
+            obj = self._cls(**json.loads(row[0]))
+            self._remember(obj_id, obj)
+            return obj
+
+    def __setitem__(self, obj_id: str, obj: TypeVar('Base')):
+        """ Upsert the row of an object
+        """
+        with self._lock:
+            self._conn.execute(self._upsert, self._row(obj))
+            self._remember(obj_id, obj)
+
+    def __delitem__(self, obj_id: str):
+        """ Delete the row of an object
+        """
+        with self._lock:
+            self._cache.pop(obj_id, None)
+            cursor = self._conn.execute(
+                "DELETE FROM {} WHERE id = ?".format(self._table), (obj_id,))
+            if not cursor.rowcount:
+                raise KeyError(obj_id)
+
+    def __contains__(self, obj_id: object) -> bool:
+        """ Id membership, without building the object
+        """
+        with self._lock:
+            if obj_id in self._cache:
+                return True
+            return self._conn.execute(
+                "SELECT 1 FROM {} WHERE id = ?".format(self._table),
+                (obj_id,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        """ Number of rows
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM {}".format(self._table)).fetchone()[0]
+
+    def __iter__(self) -> Iterator[str]:
+        """ Ids in insertion order, read in batches
+        """
+        rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT rowid, id FROM {} WHERE rowid > ? "
+                    "ORDER BY rowid LIMIT ?".format(self._table),
+                    (rowid, BATCH_SIZE)).fetchall()
+            for rowid, obj_id in rows:
+                yield obj_id
+            if len(rows) < BATCH_SIZE:
+                return
+
+    def walk_ids(self, reverse: bool = False) -> Iterator[str]:
+        """ Ids in id order, read in batches
+        """
+        cursor = None
+        while True:
+            ids = self.ids_after(cursor, BATCH_SIZE, reverse)
+            yield from ids
+            if len(ids) < BATCH_SIZE:
+                return
+            cursor = ids[-1]
+
+    def ids_after(self, cursor: Optional[str], count: int,
+                  reverse: bool = False) -> List[str]:
+        """ Up to `count` ids in id order after the id `cursor`
+        """
+        where = "" if cursor is None else \
+            "WHERE id {} ?".format("<" if reverse else ">")
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT id FROM {} {} ORDER BY id {} LIMIT ?".format(
+                    self._table, where, "DESC" if reverse else "ASC"),
+                (() if cursor is None else (cursor,)) + (count,))]
+
+    def ordered_ids(self) -> _IdOrder:
+        """ Ids in id order
+        """
+        return _IdOrder(self)
+
+    def select_ids(self, attr: str, value: Any, exclude: Optional[str] = None,
+                   limit: int = -1) -> List[str]:
+        """ Ids of the rows whose indexed column `attr` is value
+        """
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT id FROM {} WHERE {} IS ? AND id IS NOT ? "
+                "LIMIT ?".format(self._table, _quote(attr)),
+                (value, exclude, limit))]
+
+    def indexes(self) -> Dict[str, SqliteIndex]:
+        """ Indexes of the table, with the interface of HashIndex
+        """
+        return {attr: SqliteIndex(self, attr, attr in self._cls.__unique__)
+                for attr in self._attrs}
+
+    def replace(self, objs: MutableMapping[str, TypeVar('Base')]):
+        """ Replace every row with the given objects, in one transaction
+        """
+        with self._lock:
+            self._cache.clear()
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.execute("DELETE FROM {}".format(self._table))
+                for obj_id in list(objs):
+                    try:
+                        obj = objs[obj_id]
+                    except KeyError:
+                        continue  # removed while writing
+                    self._conn.execute(self._upsert, self._row(obj))
+
+    def clear_cache(self):
+        """ Forget the cached objects
+        """
+        with self._lock:
+            self._cache.clear()
+
+
+class SqliteStorage(FileStorage):
+    """ SQLite storage: one table per class in a WAL-mode database
+
+    Objects of a loaded class are written by the SqliteObjects mapping
+    that load() returns; saved() and removed() write the others. When
+    another process commits, refresh() drops the cached objects.
+    """
+
+    def __init__(self, snapshot=None, db_path: str = ".db.sqlite3",
+                 cache_size: int = 10000):
+        """ Open the database
+        """
+        super().__init__(snapshot)
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._tables: Dict[str, SqliteObjects] = {}
+        self._data_version = self._version()
+
+    def _version(self) -> int:
+        """ Counter that changes when another connection commits
+        """
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _table(self, cls) -> SqliteObjects:
+        """ Table of a class, created and imported from its snapshot on
+        first use
+        """
+        with self._lock:
+            objs = self._tables.get(cls.__name__)
+            if objs is None:
+                objs = SqliteObjects(cls, self._conn, self._lock,
+                                     self.cache_size)
+                if objs.create():
+                    objs.replace(self.snapshot.load(cls))
+                self._tables[cls.__name__] = objs
+            return objs
+
+    def load(self, cls) -> SqliteObjects:
+        """ Table of a class, with an empty cache
+        """
+        objs = self._table(cls)
+        objs.clear_cache()
+        return objs
+
+    def save_all(self, cls, objs: MutableMapping[str, TypeVar('Base')]):
+        """ Write all objects of a class, unless objs is the table itself
+        """
+        table = self._table(cls)
+        if objs is not table:
+            table.replace(objs)
+
+    def saved(self, cls, obj: TypeVar('Base'),
+              objs: MutableMapping[str, TypeVar('Base')]):
+        """ Upsert the row of a saved object, unless objs is the table,
+        which did it when the object was stored
+
+        Classes that were never loaded keep their objects in memory, as
+        with the file engine, and are written through here.
+        """
+        table = self._table(cls)
+        if objs is not table:
+            table[obj.id] = obj
+
+    def removed(self, cls, obj: TypeVar('Base'),
+                objs: MutableMapping[str, TypeVar('Base')]):
+        """ Delete the row of a removed object, unless objs is the table,
+        which did it when the object was removed
+        """
+        table = self._table(cls)
+        if objs is not table:
+            try:
+                del table[obj.id]
+            except KeyError:
+                pass
+
+    def refresh(self, cls) -> None:
+        """ Drop the cached objects if another process committed
+        """
+        version = self._version()
+        if version != self._data_version:
+            self._data_version = version
+            with self._lock:
+                for objs in self._tables.values():
+                    objs.clear_cache()
+        return None
@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+""" Storage engines for models.base
+
+The engine is picked once from the MODELS_STORAGE environment variable:
+  - "file" (default): every mutation rewrites the snapshot of the class
+  - "journal": mutations are appended to .db_<Class>.journal and folded
+    back into the snapshot by a background compaction
+  - "write_behind": mutations mark the class dirty and a background
+    thread coalesces them into occasional snapshot rewrites
+  - "shared_journal": the journal engine for several processes sharing
+    the files: writers take an advisory lock and readers pick up the
+    records appended by other processes
+  - "sqlite": one table per class in an SQLite database, with a bounded
+    object cache (see models.sqlite)
+
+MODELS_SNAPSHOT_FORMAT picks the snapshot format of any engine,
+"json" (default) or "binary" (see models.snapshot).
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from os import path
+from typing import (Dict, Iterator, List, MutableMapping, Optional, Tuple,
+                    TypeVar)
+
+from models.snapshot import FORMATS, JsonSnapshot
+
+
+class FileStorage():
+    """ Whole-file storage: each mutation rewrites the snapshot
+    """
+
+    def __init__(self, snapshot=None):
+        """ Initialize the engine with a snapshot format
+        """
+        self.snapshot = snapshot or JsonSnapshot()
+
+    def load(self, cls) -> MutableMapping[str, TypeVar('Base')]:
+        """ Load all objects of a class
+        """
+        return self.snapshot.load(cls)
+
+    def save_all(self, cls, objs: MutableMapping[str, TypeVar('Base')]):
+        """ Write all objects of a class
+        """
+        self.snapshot.write(cls, objs)
+
+    def saved(self, cls, obj: TypeVar('Base'),
+              objs: MutableMapping[str, TypeVar('Base')]):
+        """ Persist a saved object
+        """
+        self.save_all(cls, objs)
+
+    def removed(self, cls, obj: TypeVar('Base'),
+                objs: MutableMapping[str, TypeVar('Base')]):
+        """ Persist a removed object
+        """
+        self.save_all(cls, objs)
+
+    def refresh(self, cls) -> Optional[Tuple[str, object]]:
+        """ Changes made to a class by other processes since it was
+        loaded (none for this engine)
+
+        Engines shared between processes return ("reload", objects) or
+        ("apply", [(op, id, object or None), ...]).
+        """
+        return None
+
+    def flush(self):
+        """ Write pending mutations (none for this engine)
+        """
+
+
+class WriteBehindStorage(FileStorage):
+    """ Whole-file storage with coalesced background writes
+
+    A mutation only marks its class dirty. A background thread rewrites
+    the dirty classes `interval` seconds after the first pending
+    mutation, or as soon as `max_pending` mutations are pending, so a
+    burst of saves costs a handful of rewrites. `interval` is the most a
+    crash can lose; flush() writes everything now and runs at exit.
+    """
+
+    def __init__(self, snapshot=None, interval: float = 1.0,
+                 max_pending: int = 1000):
+        """ Initialize the engine
+        """
+        super().__init__(snapshot)
+        self.interval = interval
+        self.max_pending = max_pending
+        self.writes = 0
+        self._dirty: Dict[str, Tuple[type, MutableMapping]] = {}
+        self._pending = 0
+        self._deadline: Optional[float] = None
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        atexit.register(self.flush)
+
+    def _mark(self, cls, objs: MutableMapping[str, TypeVar('Base')]):
+        """ Mark a class dirty and wake the flusher when due
+        """
+        with self._cond:
+            self._dirty[cls.__name__] = (cls, objs)
+            self._pending += 1
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run,
+                                                 daemon=True)
+                self._flusher.start()
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self.interval
+                self._cond.notify()
+            elif self._pending >= self.max_pending:
+                self._cond.notify()
+
+    def _run(self):
+        """ Flusher loop: wait until a flush is due, then flush
+        """
+        while True:
+            with self._cond:
+                while not self._dirty or (
+                        self._pending < self.max_pending and
+                        time.monotonic() < self._deadline):
+                    self._cond.wait(None if not self._dirty else
+                                    max(0, self._deadline -
+                                        time.monotonic()))
+            self.flush()
+
+    def flush(self):
+        """ Write every dirty class now
+        """
+        with self._write_lock:
+            with self._cond:
+                dirty = self._dirty
+                self._dirty = {}
+                self._pending = 0
+                self._deadline = None
+            for cls, objs in dirty.values():
+                self.snapshot.write(cls, objs)
+                self.writes += 1
+
+    def load(self, cls) -> MutableMapping[str, TypeVar('Base')]:
+        """ Load all objects of a class, after writing pending ones
+        """
+        self.flush()
+        return super().load(cls)
+
+    def save_all(self, cls, objs: MutableMapping[str, TypeVar('Base')]):
+        """ Write all objects of a class now
+        """
+        with self._write_lock:
+            with self._cond:
+                self._dirty.pop(cls.__name__, None)
+            self.snapshot.write(cls, objs)
+            self.writes += 1
+
+    def saved(self, cls, obj: TypeVar('Base'),
+              objs: MutableMapping[str, TypeVar('Base')]):
+        """ Mark the class of a saved object dirty
+        """
+        self._mark(cls, objs)
+
+    def removed(self, cls, obj: TypeVar('Base'),
+                objs: MutableMapping[str, TypeVar('Base')]):
+        """ Mark the class of a removed object dirty
+        """
+        self._mark(cls, objs)
+
+
+class _Journal():
+    """ Append-only journal of one class
+    """
+
+    def __init__(self, cls):
+        """ Open the journal for appending
+        """
+        self.cls = cls
+        self.path = ".db_{}.journal".format(cls.__name__)
+        self.compacting_path = self.path + ".compacting"
+        self.lock = threading.Lock()
+        self.records = 0
+        self.last_sync = time.monotonic()
+        self.compaction: Optional[threading.Thread] = None
+        self._drop_torn_tail()
+        self.file = open(self.path, 'a')
+
+    def _drop_torn_tail(self):
+        """ Cut a partial last record left by a crash mid-append, so new
+        records are not glued to it
+        """
+        if not path.exists(self.path):
+            return
+        with open(self.path, 'r+b') as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def sync(self):
+        """ Flush and fsync the journal
+        """
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def rotate(self):
+        """ Move the journal aside for compaction and start a new one
+
+        Called with the lock held.
+        """
+        self.sync()
+        self.file.close()
+        if path.exists(self.compacting_path):
+            # A previous compaction did not finish: fold into it
+            with open(self.path, 'r') as src, \
+                    open(self.compacting_path, 'a') as dst:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.compacting_path)
+        self.file = open(self.path, 'a')
+        self.records = 0
+
+
+def replay(cls, objs: MutableMapping[str, TypeVar('Base')],
+           journal_path: str):
+    """ Apply the records of a journal file to the objects of a class
+
+    A torn last line (crash mid-append) is ignored.
+    """
+    if not path.exists(journal_path):
+        return
+    with open(journal_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if record["op"] == "save":
+                objs[record["id"]] = cls(**record["obj"])
+            else:
+                objs.pop(record["id"], None)
+
+
+class JournalStorage(FileStorage):
+    """ Append-only journal storage
+
+    A save or remove appends one JSON line to .db_<Class>.journal, so a
+    mutation costs O(1) whatever the number of objects. The journal is
+    fsynced according to `fsync`: "always" after every record,
+    "interval" at most every `fsync_interval` seconds, or "never". Once
+    `compact_every` records have been appended, a background thread folds
+    the journal into the snapshot. Loading replays snapshot plus journal.
+    """
+
+    FSYNC_POLICIES = ("always", "interval", "never")
+
+    def __init__(self, snapshot=None, fsync: str = "interval",
+                 fsync_interval: float = 1.0, compact_every: int = 10000):
+        """ Initialize the engine
+        """
+        super().__init__(snapshot)
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError("fsync must be one of {}".format(
+                ", ".join(self.FSYNC_POLICIES)))
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self._journals: Dict[str, _Journal] = {}
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _journal(self, cls) -> _Journal:
+        """ Journal of a class, opened on first use
+        """
+        with self._lock:
+            journal = self._journals.get(cls.__name__)
+            if journal is None:
+                journal = self._journals[cls.__name__] = _Journal(cls)
+            return journal
+
+    def load(self, cls) -> MutableMapping[str, TypeVar('Base')]:
+        """ Rebuild all objects of a class from snapshot plus journal
+        """
+        objs = self.snapshot.load(cls)
+        replay(cls, objs, ".db_{}.journal.compacting".format(cls.__name__))
+        replay(cls, objs, ".db_{}.journal".format(cls.__name__))
+        return objs
+
+    def _append(self, cls, record: dict):
+        """ Append one record and apply the fsync and compaction policies
+        """
+        line = json.dumps(record) + "\n"
+        journal = self._journal(cls)
+        with journal.lock:
+            journal.file.write(line)
+            journal.records += 1
+            if self.fsync == "always" or (
+                    self.fsync == "interval" and
+                    time.monotonic() - journal.last_sync >=
+                    self.fsync_interval):
+                journal.sync()
+            else:
+                journal.file.flush()
+            if journal.records >= self.compact_every and (
+                    journal.compaction is None or
+                    not journal.compaction.is_alive()):
+                journal.rotate()
+                journal.compaction = threading.Thread(
+                    target=self._compact, args=(journal,), daemon=True)
+                journal.compaction.start()
+
+    def _compact(self, journal: _Journal):
+        """ Fold a rotated journal into the snapshot
+
+        Runs without the journal lock: it only reads the snapshot and the
+        rotated file, which no writer touches. Replaying the rotated file
+        again after a crash is harmless, as records are idempotent.
+        """
+        objs = self.snapshot.load(journal.cls)
+        replay(journal.cls, objs, journal.compacting_path)
+        self.snapshot.write(journal.cls, objs, fsync=True)
+        os.remove(journal.compacting_path)
+
+    def save_all(self, cls, objs: MutableMapping[str, TypeVar('Base')]):
+        """ Write a full snapshot and empty the journal
+        """
+        journal = self._journal(cls)
+        with journal.lock:
+            if journal.compaction is not None:
+                journal.compaction.join()
+            super().save_all(cls, objs)
+            journal.file.truncate(0)
+            journal.records = 0
+            if path.exists(journal.compacting_path):
+                os.remove(journal.compacting_path)
+
+    def saved(self, cls, obj: TypeVar('Base'),
+              objs: MutableMapping[str, TypeVar('Base')]):
+        """ Journal a saved object
+        """
+        return self._append(cls, {"op": "save", "id": obj.id,
+                                  "obj": obj.to_json(True)})
+
+    def removed(self, cls, obj: TypeVar('Base'),
+                objs: MutableMapping[str, TypeVar('Base')]):
+        """ Journal a removed object
+        """
+        return self._append(cls, {"op": "remove", "id": obj.id})
+
+    def flush(self):
+        """ fsync every journal
+        """
+        with self._lock:
+            journals = list(self._journals.values())
+        for journal in journals:
+            with journal.lock:
+                if not journal.file.closed:
+                    journal.sync()
+
+    def close(self):
+        """ Wait for compactions and fsync every journal
+        """
+        with self._lock:
+            journals = list(self._journals.values())
+        for journal in journals:
+            if journal.compaction is not None:
+                journal.compaction.join()
+        self.flush()
+
+
+class _SharedJournal(_Journal):
+    """ Journal of one class shared between processes
+
+    Writers hold an exclusive flock on .db_<Class>.lock, readers a shared
+    one. The size of .db_<Class>.gen is a generation counter, bumped
+    whenever the journal is rotated or emptied, so offsets read from the
+    previous journal are known to be stale.
+    """
+
+    def __init__(self, cls):
+        """ Open the lock file, then the journal under the lock
+        """
+        self.lock_file = open(".db_{}.lock".format(cls.__name__), 'a')
+        self.gen_path = ".db_{}.gen".format(cls.__name__)
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            super().__init__(cls)
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def locked(self, exclusive: bool) -> Iterator[None]:
+        """ Hold the journal against other threads and processes
+
+        flock does not exclude threads sharing the lock file, hence the
+        thread lock around it.
+        """
+        with self.lock:
+            fcntl.flock(self.lock_file,
+                        fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def generation(self) -> int:
+        """ Current generation of the journal
+        """
+        try:
+            return os.stat(self.gen_path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def bump(self) -> int:
+        """ Start a new generation; called with the exclusive lock held
+        """
+        with open(self.gen_path, 'ab') as f:
+            f.write(b"\0")
+        return self.generation()
+
+    def size(self) -> int:
+        """ Bytes in the journal
+        """
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def reopen_if_moved(self):
+        """ Reopen the journal if another process rotated it
+
+        Called with the exclusive lock held.
+        """
+        try:
+            moved = os.stat(self.path).st_ino != \
+                os.fstat(self.file.fileno()).st_ino
+        except FileNotFoundError:
+            moved = True
+        if moved:
+            self.file.close()
+            self.file = open(self.path, 'a')
+            self.records = 0
+
+    def rotate(self):
+        """ Rotate the journal and start a new generation
+        """
+        super().rotate()
+        self.bump()
+
+
+def read_from(cls, journal_path: str,
+              offset: int) -> Tuple[List[Tuple[str, str, object]], int]:
+    """ Records of a journal file after a byte offset, as
+    (op, id, object or None), and the offset after the last whole record
+    """
+    with open(journal_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    data = data[:data.rfind(b"\n") + 1]
+    changes = []
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            break
+        obj = cls(**record["obj"]) if record["op"] == "save" else None
+        changes.append((record["op"], record["id"], obj))
+    return changes, offset + len(data)
+
+
+class SharedJournalStorage(JournalStorage):
+    """ Journal storage for several processes sharing the same files
+
+    Appends, rotations and compactions hold an exclusive advisory lock,
+    loads a shared one. Each process remembers the generation and the
+    journal offset it has applied, so a refresh is two stat() calls when
+    nothing changed, and otherwise reads only the records appended since
+    (or reloads everything after a rotation, once per `compact_every`
+    records). Before appending, a writer also reads the records other
+    processes appended, so no change is missed.
+    """
+
+    def __init__(self, snapshot=None, fsync: str = "interval",
+                 fsync_interval: float = 1.0, compact_every: int = 10000):
+        """ Initialize the engine
+        """
+        super().__init__(snapshot, fsync, fsync_interval, compact_every)
+        self._seen: Dict[str, Tuple[int, int]] = {}
+
+    def _journal(self, cls) -> _SharedJournal:
+        """ Journal of a class, opened on first use
+        """
+        with self._lock:
+            journal = self._journals.get(cls.__name__)
+            if journal is None:
+                journal = self._journals[cls.__name__] = \
+                    _SharedJournal(cls)
+            return journal
+
+    def _load(self, cls, journal: _SharedJournal
+              ) -> MutableMapping[str, TypeVar('Base')]:
+        """ Load a class and remember what was read; lock held
+        """
+        objs = super().load(cls)
+        self._seen[cls.__name__] = (journal.generation(), journal.size())
+        return objs
+
+    def load(self, cls) -> MutableMapping[str, TypeVar('Base')]:
+        """ Rebuild all objects of a class from snapshot plus journal
+        """
+        journal = self._journal(cls)
+        with journal.locked(False):
+            return self._load(cls, journal)
+
+    def _changes(self, cls, journal: _SharedJournal
+                 ) -> Optional[Tuple[str, object]]:
+        """ Changes since the last load or refresh; lock held
+
+        A class this process never loaded is loaded whole, so objects
+        other processes saved are seen even if only this process's own
+        saves went through the class so far.
+        """
+        seen = self._seen.get(cls.__name__)
+        if seen is None or journal.generation() != seen[0]:
+            return ("reload", self._load(cls, journal))
+        generation, offset = seen
+        changes, offset = read_from(cls, journal.path, offset)
+        self._seen[cls.__name__] = (generation, offset)
+        journal.records += len(changes)
+        return ("apply", changes) if changes else None
+
+    def refresh(self, cls) -> Optional[Tuple[str, object]]:
+        """ Changes made to a class by other processes
+        """
+        seen = self._seen.get(cls.__name__)
+        journal = self._journal(cls)
+        if seen is not None and (journal.generation(), journal.size()) == seen:
+            return None
+        with journal.locked(False):
+            return self._changes(cls, journal)
+
+    def _append(self, cls, record: dict) -> Optional[Tuple[str, object]]:
+        """ Append one record, returning the changes other processes made
+        before it
+        """
+        line = json.dumps(record) + "\n"
+        journal = self._journal(cls)
+        with journal.locked(True):
+            journal.reopen_if_moved()
+            changes = self._changes(cls, journal)
+            journal.file.write(line)
+            journal.records += 1
+            if self.fsync == "always" or (
+                    self.fsync == "interval" and
+                    time.monotonic() - journal.last_sync >=
+                    self.fsync_interval):
+                journal.sync()
+            else:
+                journal.file.flush()
+            self._seen[cls.__name__] = (journal.generation(),
+                                        journal.size())
+            if journal.records >= self.compact_every and (
+                    journal.compaction is None or
+                    not journal.compaction.is_alive()):
+                journal.rotate()
+                self._seen[cls.__name__] = (journal.generation(), 0)
+                journal.compaction = threading.Thread(
+                    target=self._compact, args=(journal,), daemon=True)
+                journal.compaction.start()
+        return changes
+
+    def _compact(self, journal: _SharedJournal):
+        """ Fold the rotated journal into the snapshot
+
+        Holds the exclusive lock: another process may append to the
+        rotated file, and loads must not see the new snapshot next to
+        the rotated file it already contains.
+        """
+        with journal.locked(True):
+            if path.exists(journal.compacting_path):
+                super()._compact(journal)
+
+    def save_all(self, cls, objs: MutableMapping[str, TypeVar('Base')]):
+        """ Write a full snapshot and start a new, empty journal
+        """
+        journal = self._journal(cls)
+        if journal.compaction is not None:
+            journal.compaction.join()
+        with journal.locked(True):
+            journal.reopen_if_moved()
+            self.snapshot.write(cls, objs)
+            journal.file.truncate(0)
+            journal.records = 0
+            if path.exists(journal.compacting_path):
+                os.remove(journal.compacting_path)
+            self._seen[cls.__name__] = (journal.bump(), 0)
+
+    def saved(self, cls, obj: TypeVar('Base'),
+              objs: MutableMapping[str, TypeVar('Base')]
+              ) -> Optional[Tuple[str, object]]:
+        """ Journal a saved object
+        """
+        changes = super().saved(cls, obj, objs)
+        if changes is not None and changes[0] == "reload":
+            changes[1][obj.id] = obj
+        return changes
+
+    def removed(self, cls, obj: TypeVar('Base'),
+                objs: MutableMapping[str, TypeVar('Base')]
+                ) -> Optional[Tuple[str, object]]:
+        """ Journal a removed object
+        """
+        changes = super().removed(cls, obj, objs)
+        if changes is not None and changes[0] == "reload":
+            changes[1].pop(obj.id, None)
+        return changes
+
+
+_storage = None
+
+
+def get_storage() -> FileStorage:
+    """ Storage engine selected by MODELS_STORAGE, created once
+
+    The journal engine reads MODELS_JOURNAL_FSYNC ("always", "interval"
+    or "never"), MODELS_JOURNAL_FSYNC_INTERVAL (seconds) and
+    MODELS_JOURNAL_COMPACT_EVERY (records). The write-behind engine reads
+    MODELS_WRITE_BEHIND_INTERVAL (seconds, the data-loss window) and
+    MODELS_WRITE_BEHIND_MAX_PENDING (mutations). The shared journal
+    engine reads the same settings as the journal engine. The SQLite
+    engine reads MODELS_SQLITE_PATH and MODELS_SQLITE_CACHE_SIZE
+    (objects per class).
+    """
+    global _storage
+    if _storage is None:
+        engine = os.getenv("MODELS_STORAGE", "file")
+        snapshot_format = os.getenv("MODELS_SNAPSHOT_FORMAT", "json")
+        if snapshot_format not in FORMATS:
+            raise ValueError("Unknown MODELS_SNAPSHOT_FORMAT: {}".format(
+                snapshot_format))
+        snapshot = FORMATS[snapshot_format]()
+        if engine in ("journal", "shared_journal"):
+            engine_cls = JournalStorage if engine == "journal" else \
+                SharedJournalStorage
+            _storage = engine_cls(
+                snapshot,
+                fsync=os.getenv("MODELS_JOURNAL_FSYNC", "interval"),
+                fsync_interval=float(
+                    os.getenv("MODELS_JOURNAL_FSYNC_INTERVAL", "1")),
+                compact_every=int(
+                    os.getenv("MODELS_JOURNAL_COMPACT_EVERY", "10000")))
+        elif engine == "write_behind":
+            _storage = WriteBehindStorage(
+                snapshot,
+                interval=float(
+                    os.getenv("MODELS_WRITE_BEHIND_INTERVAL", "1")),
+                max_pending=int(
+                    os.getenv("MODELS_WRITE_BEHIND_MAX_PENDING", "1000")))
+        elif engine == "sqlite":
+            from models.sqlite import SqliteStorage
+            _storage = SqliteStorage(
+                snapshot,
+                db_path=os.getenv("MODELS_SQLITE_PATH", ".db.sqlite3"),
+                cache_size=int(
+                    os.getenv("MODELS_SQLITE_CACHE_SIZE", "10000")))
+        elif engine == "file":
+            _storage = FileStorage(snapshot)
+        else:
+            raise ValueError("Unknown MODELS_STORAGE: {}".format(engine))
+    return _storage
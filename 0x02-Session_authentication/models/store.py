@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+""" Concurrent object store for models.base
+
+Objects live in one insertion-ordered dict, so iteration follows the
+order objects were loaded or first saved, whatever the process.
+Writers of one id serialize on a lock picked by the hash of the id, out
+of STRIPES, so writers of different ids rarely contend; the dict itself
+is only locked for the single operation that changes it.
+
+Readers never lock while iterating: snapshot() marks the dict shared and
+returns it as it is, and the next write copies it before changing it
+(copy-on-write), leaving the reader with an unchanging view. A copy
+costs about as much as the iteration that made it necessary, and happens
+at most once per snapshot.
+"""
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+STRIPES = 64
+
+
+# Named after the striped writer locks of lock(); the objects themselves
+# are in a single dict, changed under one lock held only inside methods.
+class StripedObjects(MutableMapping):
+    """ {id: object} with lock-striped writers and copy-on-write
+    snapshots for readers
+
+    Lookups read the current dict without locking. Iteration goes over a
+    snapshot, in insertion order: ids stored or removed afterwards do not
+    show up in it.
+    """
+
+    def __init__(self, items: Optional[Dict[str, Any]] = None,
+                 stripes: int = STRIPES):
+        """ Store the given items; `stripes` must be a power of two
+        """
+        self._mask = stripes - 1
+        self._writers = [threading.Lock() for _ in range(stripes)]
+        self._lock = threading.Lock()
+        self._dict: Dict[str, Any] = dict(items) if items else {}
+        self._shared = False
+
+    def lock(self, obj_id: str) -> threading.Lock:
+        """ Writer lock of the stripe of an id, for read-modify-write
+        sequences
+
+        The store only takes its own lock inside its methods, so callers
+        holding a writer lock can call back into the store, or take their
+        own locks, without lock-order inversions.
+        """
+        return self._writers[hash(obj_id) & self._mask]
+
+    def _writable(self) -> Dict[str, Any]:
+        """ Dict to modify, copied first if a snapshot holds it; called
+        with the lock held
+        """
+        if self._shared:
+            self._dict = dict(self._dict)
+            self._shared = False
+        return self._dict
+
+    def _get(self, obj_id: str) -> Any:
+        """ Stored item of an id, without locking
+        """
+        return self._dict[obj_id]
+
+    def _replace(self, obj_id: str, old: Any, new: Any) -> Any:
+        """ Store `new` if `old` is still the item of obj_id; return the
+        item stored once done
+        """
+        with self._lock:
+            current = self._dict.get(obj_id)
+            if current is not old:
+                return new if current is None else current
+            self._writable()[obj_id] = new
+            return new
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ Current dict, which writers will copy instead of changing
+        """
+        with self._lock:
+            self._shared = True
+            return self._dict
+
+    def _items(self) -> Iterator[Tuple[str, Any]]:
+        """ (id, stored item) pairs of a snapshot, in insertion order
+        """
+        return iter(self.snapshot().items())
+
+    def __getitem__(self, obj_id: str) -> Any:
+        """ Object by id
+        """
+        return self._dict[obj_id]
+
+    def __setitem__(self, obj_id: str, obj: Any):
+        """ Store an object
+        """
+        with self._lock:
+            self._writable()[obj_id] = obj
+
+    def __delitem__(self, obj_id: str):
+        """ Delete an object
+        """
+        with self._lock:
+            if obj_id not in self._dict:
+                raise KeyError(obj_id)
+            del self._writable()[obj_id]
+
+    def __contains__(self, obj_id: object) -> bool:
+        """ Id membership
+        """
+        try:
+            return obj_id in self._dict
+        except TypeError:
+            return False
+
+    def __iter__(self) -> Iterator[str]:
+        """ Ids of a snapshot, in insertion order
+        """
+        return iter(self.snapshot())
+
+    def __len__(self) -> int:
+        """ Number of objects
+        """
+        return len(self._dict)
@@ -7,6 +7,9 @@ from models.base import Base
 class UserSession(Base):
     """UserSession model to store session data with user and session ID."""
 
+    __slots__ = ('user_id', 'session_id')
+    __indexes__ = ('session_id',)
+
     def __init__(self, *args: list, **kwargs: dict):
         """Initialize UserSession with user_id and session_id."""
         super().__init__(*args, **kwargs)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+""" search finds objects by their current attribute values
+"""
+import os
+import tempfile
+import unittest
+
+from models.base import DATA, INDEXES, ORDERS
+from models.snapshot import JsonSnapshot
+from models.storage import FileStorage
+import models.storage
+from models.user import User
+
+
+class TestSearch(unittest.TestCase):
+    """ User.search through the email index
+    """
+
+    def setUp(self):
+        """ Saved users in an empty directory
+        """
+        self.cwd = os.getcwd()
+        self.dir = tempfile.TemporaryDirectory()
+        os.chdir(self.dir.name)
+        self.storage = models.storage._storage
+        models.storage._storage = FileStorage(JsonSnapshot())
+        for registry in (DATA, INDEXES, ORDERS):
+            registry.pop('User', None)
+        self.bob = User(email="bob@hbtn.io")
+        self.bob.save()
+        User(email="ann@hbtn.io").save()
+
+    def tearDown(self):
+        models.storage._storage = self.storage
+        for registry in (DATA, INDEXES, ORDERS):
+            registry.pop('User', None)
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_unsaved_change(self):
+        """ A changed email is found before the user is saved again
+        """
+        self.assertEqual(User.query().filter(email="x").plan(),
+                         "index:email")
+        self.bob.email = "robert@hbtn.io"
+        self.assertEqual(User.search({'email': "robert@hbtn.io"}),
+                         [self.bob])
+        self.assertEqual(User.search({'email': "bob@hbtn.io"}), [])
+        self.bob.save()
+        self.assertEqual(User.search({'email': "robert@hbtn.io"}),
+                         [self.bob])
+
+    def test_unsaved_object(self):
+        """ Objects that were never saved stay out of the index
+        """
+        User(email="eve@hbtn.io").email = "bob@hbtn.io"
+        self.assertEqual(User.search({'email': "bob@hbtn.io"}), [self.bob])
+        self.assertEqual(User.search({'email': "eve@hbtn.io"}), [])
+
+    def test_removed_object(self):
+        """ A removed object is not indexed again when changed
+        """
+        self.bob.remove()
+        self.bob.email = "ann@hbtn.io"
+        self.assertEqual(len(User.search({'email': "ann@hbtn.io"})), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
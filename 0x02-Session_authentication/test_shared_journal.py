@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+""" Processes sharing a journal see each other's sessions
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from models.base import DATA, INDEXES, ORDERS
+from models.snapshot import JsonSnapshot
+from models.storage import SharedJournalStorage
+import models.storage
+from models.user_session import UserSession
+
+PROJECT = os.path.dirname(os.path.abspath(__file__))
+
+SAVE = """
+from models.user_session import UserSession
+UserSession(user_id="u1", session_id="from-child").save()
+UserSession.flush()
+"""
+
+FIND = """
+from models.user_session import UserSession
+session = UserSession.query().filter(session_id="from-parent").first()
+print(session.user_id if session else None)
+"""
+
+
+class TestSharedJournal(unittest.TestCase):
+    """ UserSession under MODELS_STORAGE=shared_journal, never loaded
+    """
+
+    def setUp(self):
+        """ An empty directory and a fresh engine in this process
+        """
+        self.cwd = os.getcwd()
+        self.dir = tempfile.TemporaryDirectory()
+        os.chdir(self.dir.name)
+        self.storage = models.storage._storage
+        models.storage._storage = SharedJournalStorage(JsonSnapshot())
+        for registry in (DATA, INDEXES, ORDERS):
+            registry.pop('UserSession', None)
+
+    def tearDown(self):
+        models.storage._storage.close()
+        models.storage._storage = self.storage
+        for registry in (DATA, INDEXES, ORDERS):
+            registry.pop('UserSession', None)
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def run_child(self, code: str) -> str:
+        """ Run code in another process sharing the directory
+        """
+        env = dict(os.environ, MODELS_STORAGE="shared_journal",
+                   PYTHONPATH=PROJECT)
+        return subprocess.run([sys.executable, "-c", code], env=env,
+                              check=True, capture_output=True,
+                              text=True).stdout.strip()
+
+    def test_saved_elsewhere(self):
+        """ A session saved by another process is found here
+        """
+        self.run_child(SAVE)
+        session = UserSession.query().filter(session_id="from-child").first()
+        self.assertIsNotNone(session)
+        self.assertEqual(session.user_id, "u1")
+
+    def test_saved_here(self):
+        """ A session saved here is found by another process, and one it
+        saves afterwards is found here along with ours
+        """
+        UserSession(user_id="u2", session_id="from-parent").save()
+        UserSession.flush()
+        self.assertEqual(self.run_child(FIND), "u2")
+        self.run_child(SAVE)
+        self.assertEqual(
+            sorted(s.session_id for s in UserSession.all()),
+            ["from-child", "from-parent"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -151,7 +151,7 @@ def get_reset_password_token() -> str:
 
 @app.route('/reset_password', methods=['PUT'], strict_slashes=False)
 def update_password() -> str:
-"""
+    """
     PUT /reset_password route to update the user's password.
 
     Expects:
@@ -3,14 +3,13 @@
 Authentication module
 """
 
-import bcrypt
 import uuid
 from uuid import uuid4
-from db import DB, User
-from bcrypt import hashpw, gensalt, checkpw
-from typing import Optional
-from sqlalchemy.orm.exc import NoResultFound
-from sqlalchemy.exc import InvalidRequestError
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    # bcrypt and SQLAlchemy are imported on first use to keep startup fast
+    from db import DB, User
 
 
 def _hash_password(password: str) -> bytes:
@@ -23,6 +22,7 @@ def _hash_password(password: str) -> bytes:
     Returns:
         bytes: The hashed password as bytes.
     """
+    import bcrypt
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
 
@@ -36,9 +36,22 @@ class Auth:
 
     def __init__(self):
         """Initialize an Auth instance."""
-        self._db = DB()
+        self.__db = None
+
+    @property
+    def _db(self) -> "DB":
+        """
+        DB instance, created on first use.
 
-    def register_user(self, email: str, password: str) -> User:
+        Creating it opens the engine and resets the tables, so it is put
+        off until a request actually needs the database.
+        """
+        if self.__db is None:
+            from db import DB
+            self.__db = DB()
+        return self.__db
+
+    def register_user(self, email: str, password: str) -> "User":
         """
         Register a new user in the authentication system.
 
@@ -52,6 +65,8 @@ class Auth:
         Raises:
             ValueError: If a user with the provided email already exists.
         """
+        from sqlalchemy.orm.exc import NoResultFound
+
         try:
             # Check if the user already exists
             self._db.find_user_by(email=email)
@@ -75,11 +90,14 @@ class Auth:
             bool: True if the user exists and the password matches,
                   otherwise False.
         """
+        from sqlalchemy.orm.exc import NoResultFound
+        import bcrypt
+
         try:
             # Find the user by email
             user = self._db.find_user_by(email=email)
             # Check if the pwd matches the hashed password stored in the DB
-            if checkpw(password.encode(
+            if bcrypt.checkpw(password.encode(
                     'utf-8'), user.hashed_password.encode('utf-8')):
                 return True
             else:
@@ -99,6 +117,8 @@ class Auth:
         Returns:
             str: The session ID.
         """
+        from sqlalchemy.orm.exc import NoResultFound
+
         try:
             user = self._db.find_user_by(email=email)
         except NoResultFound:
@@ -110,7 +130,7 @@ class Auth:
         return session_id
 
     def get_user_from_session_id(
-            self, session_id: Optional[str]) -> Optional[User]:
+            self, session_id: Optional[str]) -> Optional["User"]:
         """
         Retrieve a user by their session ID.
 
@@ -121,6 +141,8 @@ class Auth:
             Optional[User]: The user corresponding to the session ID,
                             or None if not found or session_id is None.
         """
+        from sqlalchemy.orm.exc import NoResultFound
+
         if session_id is None:
             return None
         try:
@@ -155,6 +177,8 @@ class Auth:
         Raises:
             ValueError: If no user with the provided email exists.
         """
+        from sqlalchemy.orm.exc import NoResultFound
+
         try:
             user = self._db.find_user_by(email=email)
             # Generate a UUID for the reset token
@@ -165,22 +189,24 @@ class Auth:
         except NoResultFound:
             raise ValueError
 
-        def update_password(self, reset_token: str, password: str) -> None:
-    """
-    Update the user's password.
+    def update_password(self, reset_token: str, password: str) -> None:
+        """
+        Update the user's password.
 
-    Args:
-        reset_token (str): The reset token for the user.
-        password (str): The new password.
+        Args:
+            reset_token (str): The reset token for the user.
+            password (str): The new password.
 
-    Raises:
-        ValueError: If no user is found with the given reset token.
-    """
-    try:
-        user = self._db.find_user_by(reset_token=reset_token)
-        hashed_password = _hash_password(password).decode('utf-8')
-        # Update the user's password and reset the reset_token field
-        self._db.update_user(
-            user.id, hashed_password=hashed_password, reset_token=None)
-    except NoResultFound:
-        raise ValueError
+        Raises:
+            ValueError: If no user is found with the given reset token.
+        """
+        from sqlalchemy.orm.exc import NoResultFound
+
+        try:
+            user = self._db.find_user_by(reset_token=reset_token)
+            hashed_password = _hash_password(password).decode('utf-8')
+            # Update the user's password and reset the reset_token field
+            self._db.update_user(
+                user.id, hashed_password=hashed_password, reset_token=None)
+        except NoResultFound:
+            raise ValueError
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the entry modules of each project.
+
+Every module is imported in a fresh interpreter run with `-X importtime`
+from its project directory. The output is parsed into a report of the
+total import time and the heaviest dependencies, and the script exits
+non-zero if a module is over its budget or fails to import.
+
+Budgets are multiples of the baseline, the time a bare `python -c pass`
+spends importing its startup modules, so they hold on slower and faster
+hosts alike. Each time is the best of several runs, to leave out noise.
+
+    ./import_budget.py            # check every budget
+    ./import_budget.py -v         # also list the heaviest imports
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# (project directory, module) -> budget in multiples of the baseline,
+# about twice what each module measured when the budget was set
+BUDGETS: Dict[Tuple[str, str], float] = {
+    ("0x00-personal_data", "filtered_logger"): 9.0,
+    ("0x00-personal_data", "encrypt_password"): 5.0,
+    ("0x03-user_authentication_service", "auth"): 7.0,
+    ("0x03-user_authentication_service", "app"): 55.0,
+}
+
+
+class ImportTime(NamedTuple):
+    """One line of `-X importtime` output."""
+    self_us: int
+    cumulative_us: int
+    depth: int
+    name: str
+
+
+def parse_importtime(stderr: str) -> List[ImportTime]:
+    """
+    Parses `-X importtime` lines into records.
+    Args:
+        stderr (str): The interpreter's standard error.
+    Returns:
+        List[ImportTime]: One record per imported module.
+    """
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append(ImportTime(int(self_us), int(cumulative_us), depth,
+                                  name.strip()))
+    return records
+
+
+def measure(project: str, module: str) -> List[ImportTime]:
+    """
+    Imports a module in a fresh interpreter and returns its import times.
+    Args:
+        project (str): Project directory, relative to the repo root.
+        module (str): Module name importable from that directory.
+    Returns:
+        List[ImportTime]: The parsed report.
+    Raises:
+        RuntimeError: If the import fails.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "import {}".format(module)],
+        cwd=os.path.join(ROOT, project), capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return parse_importtime(proc.stderr)
+
+
+def best_of(runs: int, project: str,
+            module: str) -> Tuple[float, List[ImportTime]]:
+    """
+    Imports a module `runs` times and keeps the fastest run.
+    Args:
+        runs (int): Number of fresh interpreters to start.
+        project (str): Project directory, relative to the repo root.
+        module (str): Module name importable from that directory.
+    Returns:
+        Tuple[float, List[ImportTime]]: The module's import time in
+        milliseconds and the report of that run.
+    """
+    best = None
+    for _ in range(runs):
+        records = measure(project, module)
+        # The measured module is the last top-level line
+        total = [r for r in records if r.depth == 0][-1].cumulative_us
+        if best is None or total < best[0]:
+            best = (total, records)
+    return best[0] / 1000.0, best[1]
+
+
+def baseline(runs: int) -> float:
+    """
+    Milliseconds a bare interpreter spends importing its startup modules.
+    Args:
+        runs (int): Number of fresh interpreters to start.
+    Returns:
+        float: The fastest of the runs.
+    """
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "pass"],
+            capture_output=True, text=True, check=True)
+        total = sum(r.cumulative_us for r in parse_importtime(proc.stderr)
+                    if r.depth == 0)
+        best = total if best is None else min(best, total)
+    return best / 1000.0
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    Checks every budget and prints the report.
+    Returns:
+        int: The process exit status.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="list the heaviest imports of each module")
+    parser.add_argument("-n", "--top", type=int, default=5)
+    parser.add_argument("-r", "--runs", type=int, default=5,
+                        help="interpreters started per measurement")
+    args = parser.parse_args(argv)
+
+    unit = baseline(args.runs)
+    print("baseline: {:.1f} ms".format(unit))
+    failures = 0
+    for (project, module), budget in BUDGETS.items():
+        label = "{}/{}".format(project, module)
+        try:
+            total, records = best_of(args.runs, project, module)
+        except RuntimeError as e:
+            print("FAIL  {:<50} import error: {}".format(label, e))
+            failures += 1
+            continue
+        ok = total <= budget * unit
+        failures += not ok
+        print("{}  {:<50} {:7.1f} ms = {:5.1f}x / {:4.0f}x".format(
+            "ok  " if ok else "FAIL", label, total, total / unit, budget))
+        if args.verbose:
+            for r in sorted(records, key=lambda r: r.self_us,
+                            reverse=True)[:args.top]:
+                print("      {:>8.1f} ms self  {}".format(
+                    r.self_us / 1000.0, r.name))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())